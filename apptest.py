@@ -1,10 +1,17 @@
 import streamlit as st
 import pandas as pd
-import requests
-import json
 import re
 from difflib import SequenceMatcher
-from requests.auth import HTTPBasicAuth
+from bom_cache import get_bom_cache
+from cin7_client import get_cin7_client, Cin7Error
+from sales_orders import get_order_finder, order_line_items
+from so_mirror import get_so_mirror
+from product_store import get_product_store
+from po_jobs import get_job_runner
+from po_journal import get_po_journal
+from po_push import po_references, push_pos_batched, push_pos_concurrently, push_pos_once
+from po_ui import batch_mode_panel, queue_po_job, show_po_jobs, sidebar_panels
+from catalogue import compact_products, index_products, join_products, sales_order_lines
 
 # ---------------------------------------------------------
 # PAGE CONFIG
@@ -19,24 +26,77 @@ cin7 = st.secrets["cin7"]
 base_url = cin7["base_url"].rstrip("/")
 api_username = cin7["api_username"]
 api_key = cin7["api_key"]
-auth = HTTPBasicAuth(api_username, api_key)
+
+# One pooled keep-alive session per process, shared by every session.
+# Rate limits default to Cin7's published 3/sec and 60/min per account.
+cin7_client = get_cin7_client(
+    base_url, api_username, api_key,
+    pool_size=int(cin7.get("pool_size", 10)),
+    rate_per_second=int(cin7.get("rate_per_second", 3)),
+    rate_per_minute=int(cin7.get("rate_per_minute", 60)),
+)
 
 branch_Hamilton = cin7.get("branch_Hamilton", 230)
 branch_Avondale = cin7.get("branch_Avondale", 3)
 
+# Max concurrent BOM lookups in flight (keep under Cin7's rate limit)
+bom_max_workers = int(cin7.get("bom_max_workers", 4))
+
+# Max supplier POs pushed in parallel
+po_max_workers = int(cin7.get("po_max_workers", 4))
+
+# Max POs per PurchaseOrders POST in batch mode
+po_batch_size = int(cin7.get("po_batch_size", 50))
+
+# Max sales-order searches in flight in batch mode
+so_max_workers = int(cin7.get("so_max_workers", 4))
+
+# Found sales orders are reused for this many seconds
+order_finder = get_order_finder(ttl=int(cin7.get("so_cache_ttl", 120)))
+
+# Optional local mirror of recent open sales orders (synced on modifiedDate)
+so_mirror_interval = int(cin7.get("so_mirror_sync_interval", 300))
+so_mirror = get_so_mirror(
+    initial_days=int(cin7.get("so_mirror_days", 90)),
+    max_stale=int(cin7.get("so_mirror_max_stale", 2 * so_mirror_interval)),
+) if cin7.get("so_mirror", False) else None
+
+# Product catalogue source: "cin7" reads the locally synced Cin7 catalogue
+catalogue_source = cin7.get("catalogue_source", "csv")
+product_store = get_product_store() if catalogue_source == "cin7" else None
+product_sync_interval = int(cin7.get("product_sync_interval", 3600))
+
+# Persistent BOM cache shared by all sessions and app variants
+bom_cache = get_bom_cache(max_age=int(cin7.get("bom_cache_max_age", 3600)))
+
+# Submission journal: each PO reference is created in Cin7 at most once
+po_journal = get_po_journal()
+
+# Background PO builds: Create POs queues a job instead of blocking the page
+# Jobs are tagged with this app variant, which builds its own payloads
+po_jobs = get_job_runner(max_workers=int(cin7.get("po_job_workers", 2)), app="apptest")
+
 # ---------------------------------------------------------
-# CIN7 GET WRAPPER
+# CIN7 GET WRAPPERS (PARSED + STREAMED)
 # ---------------------------------------------------------
-def cin7_get(endpoint, params=None):
-    url = f"{base_url}/{endpoint}"
-    r = requests.get(url, params=params, auth=auth)
-    return r.json() if r.status_code == 200 else None
+def cin7_get(endpoint, params=None, fields=None):
+    return cin7_client.get(endpoint, params=params, fields=fields)
+
+def cin7_iter(endpoint, prefix="item", params=None, fields=None):
+    return cin7_client.iter_items(endpoint, prefix=prefix, params=params, fields=fields)
 
 # ---------------------------------------------------------
 # LOAD PRODUCTS (Supplier Mapping)
 # ---------------------------------------------------------
-@st.cache_data
-def load_products():
+# One compact, shared copy per process (treat products_df as read-only)
+@st.cache_resource
+def load_products(store_version=None):
+    # catalogue_source = "cin7": synced Cin7 catalogue, reloaded after each sync
+    if product_store is not None:
+        df = product_store.read_frame()
+        if not df.empty:
+            return index_products(compact_products(df))
+
     df = pd.read_csv("Products.csv")
 
     df.columns = [c.strip() for c in df.columns]
@@ -49,52 +109,33 @@ def load_products():
     df["Supplier"] = df["Supplier"].astype(str).str.strip()
     df["Code"] = df["Code"].astype(str).str.upper().str.strip()
 
-    return df
+    # Unique Code index so Step 1 can join all order lines at once
+    return index_products(compact_products(df))
 
-products_df = load_products()
+products_df = load_products(product_store.last_synced() if product_store else None)
 
 # ---------------------------------------------------------
-# BOM LOOKUP
+# BOM LOOKUP (PERSISTENT CACHE)
 # ---------------------------------------------------------
 def get_bom(code):
-    search = cin7_get("v1/BomMasters", params={"where": f"code='{code}'"})
-    if not search:
-        return []
-
-    bom_id = search[0]["id"]
-    bom_data = cin7_get(f"v2/BomMasters/{bom_id}")
-    if not bom_data:
-        return []
-
-    comps = bom_data.get("products", [])
-    out = []
-    for c in comps:
-        out.append({
-            "code": c.get("code"),
-            "qty": c.get("quantity", 1),
-            "unitCost": c.get("unitCost", 0)
-        })
-    return out
+    return bom_cache.lookup(code, cin7_get)
+
+# ---------------------------------------------------------
+# BOM PREFETCH (BATCHED + CONCURRENT)
+# ---------------------------------------------------------
+def prefetch_boms(codes):
+    """
+    Expand each distinct item code once. Codes are looked up in batched
+    BomMasters searches, with at most bom_max_workers requests in flight.
+    Returns {code: components} ([] when not a BOM).
+    """
+    return bom_cache.lookup_many(codes, cin7_get, max_workers=bom_max_workers)
 
 # ---------------------------------------------------------
 # SMART ORDER SEARCH
 # ---------------------------------------------------------
 def smart_find_order(qref):
-    q = qref.strip().upper()
-
-    tests = [
-        f"reference='{q}'",
-        f"customerOrderNo='{q}'",
-        f"reference like '%{q}%'",
-        f"customerOrderNo like '%{q}%'"
-    ]
-
-    for t in tests:
-        res = cin7_get("v1/SalesOrders", params={"where": t})
-        if res:
-            return res[0]
-
-    return None
+    return order_finder.find(qref, cin7_iter, mirror=so_mirror)
 
 # ---------------------------------------------------------
 # BUILD MULTI-SUPPLIER PAYLOADS
@@ -102,11 +143,18 @@ def smart_find_order(qref):
 def build_po_payloads(qref, df):
     po_groups = []
 
+    # Resolve every BOM up front so lookups overlap instead of running per line
+    boms = prefetch_boms(df["Item Code"])
+
+    # Suppliers sharing a 4-letter prefix get distinct refs
+    contact_ids = df.groupby("Supplier")["Contact ID"].first()
+    po_refs = po_references(qref, ((name, int(cid)) for name, cid in contact_ids.items()))
+
     for supplier_name, grp in df.groupby("Supplier"):
 
         supplier_id = int(grp["Contact ID"].iloc[0])
 
-        po_ref = f"PO-{qref}{supplier_name[:4].upper()}"
+        po_ref = po_refs[supplier_name]
 
         line_items = []
 
@@ -115,7 +163,7 @@ def build_po_payloads(qref, df):
             qty = float(r["Qty"])
             cost = float(r["Cost"])
 
-            bom = get_bom(code)
+            bom = boms.get(code, [])
             if bom:
                 for c in bom:
                     line_items.append({
@@ -149,11 +197,42 @@ def build_po_payloads(qref, df):
 # PUSH SINGLE PO
 # ---------------------------------------------------------
 def push_po(payload):
-    url = f"{base_url}/v1/PurchaseOrders"
-    headers = {"Content-Type": "application/json"}
+    return cin7_client.post("v1/PurchaseOrders", [payload])
 
-    r = requests.post(url, headers=headers, data=json.dumps([payload]), auth=auth)
-    return r.status_code, r.text
+def push_po_batch(payloads):
+    return cin7_client.post("v1/PurchaseOrders", payloads)
+
+def push_supplier_pos(items, batch_mode):
+    if batch_mode:
+        return push_pos_batched(items, push_po_batch,
+                                batch_size=po_batch_size, max_workers=po_max_workers)
+    return push_pos_concurrently(items, push_po, max_workers=po_max_workers)
+
+# ---------------------------------------------------------
+# PO JOB (RUNS ON A BACKGROUND WORKER)
+# ---------------------------------------------------------
+def run_po_job(progress, qref, lines, batch_mode=True):
+    """Expand BOMs and push the POs for one Q-ref, reporting into the job store."""
+    progress.stage("Expanding BOMs")
+    payloads = build_po_payloads(qref, pd.DataFrame(lines))
+
+    progress.set_total(len(payloads))
+    progress.stage(f"Pushing {len(payloads)} PO(s)")
+
+    # Journal + Cin7 check first, so re-runs only send unsent POs
+    pushes = push_pos_once(payloads, po_journal, cin7_get,
+                           lambda items: push_supplier_pos(items, batch_mode))
+    for result in pushes:
+        progress.add_result(result)
+
+# ---------------------------------------------------------
+# SIDEBAR — BOM CACHE, SALES ORDER MIRROR, PRODUCTS + CIN7 STATS
+# ---------------------------------------------------------
+sidebar_panels(
+    cin7_client, cin7_get, bom_cache, po_journal,
+    so_mirror=so_mirror, so_mirror_interval=so_mirror_interval,
+    product_store=product_store, product_sync_interval=product_sync_interval,
+)
 
 # ---------------------------------------------------------
 # SESSION STATE SETUP
@@ -170,7 +249,11 @@ qref = st.text_input("Enter Q-number (e.g. Q19663E.S26):")
 
 if st.button("Load Order"):
 
-    so = smart_find_order(qref)
+    try:
+        so = smart_find_order(qref)
+    except Cin7Error as e:
+        st.error(f"❌ Cin7 request failed — {e}")
+        st.stop()
     if not so:
         st.error("❌ No matching Sales Order found.")
         st.stop()
@@ -183,31 +266,20 @@ if st.button("Load Order"):
     st.write("**Project:**", project)
     st.write("**Order Ref:**", qref)
 
-    rows = []
-    for li in so.get("lineItems", []):
-        if li.get("productId", 0) == 0:
-            continue
-
-        code = li.get("code", "").upper()
-        prod_match = products_df[products_df["Code"] == code]
-
-        if prod_match.empty:
-            continue
-
-        supplier = prod_match["Supplier"].iloc[0]
-        supplier_id = prod_match["Contact ID"].iloc[0]
+    try:
+        # Lines come with the found order (see sales_orders.order_line_items)
+        order_lines = sales_order_lines(order_line_items(so, cin7_iter))
+    except Cin7Error as e:
+        st.error(f"❌ Could not load the order lines — {e}")
+        st.stop()
 
-        rows.append({
-            "Select": False,
-            "Supplier": supplier,
-            "Contact ID": supplier_id,
-            "Item Code": code,
-            "Item Name": li.get("name", ""),
-            "Qty": li.get("qty", 0),
-            "Cost": li.get("unitCost", 0)
-        })
+    # One indexed join for every line instead of a catalogue scan per line
+    lines = join_products(order_lines, products_df)
+    lines.insert(0, "Select", False)
 
-    st.session_state.lines = pd.DataFrame(rows)
+    st.session_state.lines = lines[[
+        "Select", "Supplier", "Contact ID", "Item Code", "Item Name", "Qty", "Cost"
+    ]].reset_index(drop=True)
 
 # ---------------------------------------------------------
 # UI — STEP 2: Select Items
@@ -234,6 +306,11 @@ if st.session_state.lines is not None:
 
     st.header("Step 3 — Create Purchase Orders")
 
+    batch_mode = st.checkbox(
+        "Batch push (send up to po_batch_size POs per request)", value=True,
+        help="Fewer Cin7 requests; each PO still gets its own result."
+    )
+
     if st.button("Create POs"):
         selected = st.session_state.lines[st.session_state.lines["Select"] == True]
 
@@ -241,24 +318,19 @@ if st.session_state.lines is not None:
             st.error("❌ No items selected.")
             st.stop()
 
-        groups = {}
-
-        for _, r in selected.iterrows():
-            supplier = r["Supplier"]
-            groups.setdefault(supplier, []).append(r)
-
-        for supplier, items in groups.items():
-            df_grp = pd.DataFrame(items)
-            po_ref = f"PO-{qref}{supplier[:4].upper()}"
-
-            st.write(f"📦 **Creating PO:** {po_ref}")
+        # Runs on a background worker; progress is shown under PO Jobs
+        job_id = queue_po_job(po_jobs, qref, run_po_job, selected, batch_mode=batch_mode)
+        st.success(f"🧾 Queued PO job `{job_id}` for {qref}. Keep working — progress is shown under PO Jobs.")
 
-            payloads = build_po_payloads(qref, df_grp)
-
-            for sup, ref, payload in payloads:
-                status, resp = push_po(payload)
-                if status == 200:
-                    st.success(f"{ref} ✔️ Created")
-                else:
-                    st.error(f"{ref} ❌ Failed — {resp}")
+# ---------------------------------------------------------
+# BATCH MODE — MANY Q-REFS IN ONE RUN
+# ---------------------------------------------------------
+# Lines not in the catalogue are kept so batch mode can count them
+batch_mode_panel(po_jobs, run_po_job, smart_find_order, cin7_iter,
+                 lambda lines: join_products(lines, products_df, how="left"),
+                 max_workers=so_max_workers)
 
+# ---------------------------------------------------------
+# PO JOBS — BACKGROUND PROGRESS (POLLED)
+# ---------------------------------------------------------
+show_po_jobs(po_jobs, run_po_job)
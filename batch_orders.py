@@ -0,0 +1,138 @@
+"""
+Batch Orders Module
+Helpers for raising POs for many Q-refs in one run: parse the Q-ref list,
+find every sales order concurrently, and consolidate all order lines so
+catalogue and BOM lookups happen once per distinct code across the batch.
+"""
+
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from catalogue import ORDER_LINE_COLUMNS, sales_order_lines
+from cin7_client import Cin7Error
+
+# Sales-order searches in flight; the Cin7 client's rate limiter still applies
+DEFAULT_MAX_WORKERS = 4
+
+
+def parse_qrefs(text: str = "", csv_file=None) -> List[str]:
+    """
+    Collect Q-refs from pasted text and/or an uploaded CSV.
+
+    Text may be separated by newlines, commas, semicolons or whitespace. For
+    a CSV, a column named like 'Q Ref' / 'Reference' is used if present,
+    otherwise the first column.
+
+    Returns:
+        Upper-cased Q-refs in first-seen order, without duplicates
+    """
+    refs = [t for t in re.split(r"[\s,;]+", text or "") if t]
+
+    if csv_file is not None:
+        df = pd.read_csv(csv_file, dtype=str)
+        if not df.empty:
+            names = {re.sub(r"[^a-z]", "", c.lower()): c for c in df.columns}
+            col = next((names[k] for k in ("qref", "reference", "qnumber", "quote") if k in names),
+                       df.columns[0])
+            refs.extend(df[col].dropna().tolist())
+
+    return list(dict.fromkeys(r.strip().upper() for r in refs if r.strip()))
+
+
+def batch_reference(qrefs: List[str]) -> str:
+    """
+    Deterministic reference for a batch, e.g. B3F9A1C.
+
+    The same Q-ref list always gives the same reference, so re-queuing a
+    batch is caught by the PO submission journal instead of duplicating POs.
+    """
+    digest = hashlib.sha1("|".join(sorted(qrefs)).encode("utf-8")).hexdigest()
+    return f"B{digest[:6].upper()}"
+
+
+def find_orders(qrefs: List[str], find_order: Callable,
+                max_workers: int = DEFAULT_MAX_WORKERS
+                ) -> Tuple[Dict[str, Dict[str, Any]], List[str], Dict[str, str]]:
+    """
+    Find the sales order for every Q-ref concurrently.
+
+    Args:
+        qrefs: Q-refs to look up
+        find_order: The app's smart_find_order
+        max_workers: Max lookups in flight
+
+    Returns:
+        (orders, missing, errors): orders maps Q-ref to sales order, missing
+        lists Q-refs with no match, errors maps Q-ref to a Cin7 error message
+    """
+    def lookup(qref):
+        try:
+            return find_order(qref)
+        except Cin7Error as e:
+            return e
+
+    orders: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    errors: Dict[str, str] = {}
+    if not qrefs:
+        return orders, missing, errors
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(qrefs)))) as pool:
+        for qref, so in zip(qrefs, pool.map(lookup, qrefs)):
+            if isinstance(so, Cin7Error):
+                errors[qref] = str(so)
+            elif so:
+                orders[qref] = so
+            else:
+                missing.append(qref)
+    return orders, missing, errors
+
+
+def orders_to_lines(orders: Dict[str, Dict[str, Any]],
+                    line_items: Callable = lambda so: so.get("lineItems", [])) -> pd.DataFrame:
+    """
+    Flatten the line items of many sales orders, tagging each with its Q Ref.
+
+    Args:
+        orders: Q-ref to sales order, from find_orders
+        line_items: Returns an order's lineItems (e.g. streamed from Cin7)
+
+    Returns:
+        Order lines with a 'Q Ref' column
+    """
+    frames = []
+    for qref, so in orders.items():
+        lines = sales_order_lines(line_items(so))
+        lines.insert(0, "Q Ref", qref)
+        frames.append(lines)
+    if not frames:
+        return pd.DataFrame(columns=["Q Ref"] + ORDER_LINE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def consolidate_lines(lines: pd.DataFrame, extra: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Merge identical lines across orders into one line per supplier item.
+
+    Lines are grouped by Supplier, Contact ID, Item Code and Cost; quantities
+    are summed and the contributing Q-refs listed. Lines with different
+    costs stay separate so no price is averaged away.
+
+    Args:
+        lines: Order lines with Supplier and Contact ID resolved
+        extra: Additional columns to carry through (first value kept)
+
+    Returns:
+        Consolidated lines with a 'Q Refs' column
+    """
+    keys = ["Supplier", "Contact ID", "Item Code", "Cost"]
+    agg = {"Item Name": "first", "Qty": "sum", "Q Ref": lambda s: ", ".join(dict.fromkeys(s))}
+    for col in extra or []:
+        if col in lines.columns:
+            agg[col] = "first"
+    out = lines.groupby(keys, as_index=False, sort=False, dropna=False).agg(agg)
+    return out.rename(columns={"Q Ref": "Q Refs"})
@@ -0,0 +1,272 @@
+"""
+BOM Cache Module
+Persistent SQLite cache of Cin7 BOM components, keyed by product code.
+Shared by every Streamlit session and app variant on the same host.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from cin7_client import Cin7Error, chunk_values, paginate, where_any
+
+# Override with the BOM_CACHE_PATH environment variable (e.g. a mounted volume)
+DEFAULT_CACHE_PATH = os.environ.get(
+    "BOM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "bom_cache.sqlite")
+)
+
+# Seconds an entry is trusted before it is re-validated against Cin7
+DEFAULT_MAX_AGE = 3600
+
+# Fields read from BomMasters searches (validation) and details (components)
+BOM_HEADER_FIELDS = ("id", "code", "modifiedDate")
+BOM_DETAIL_FIELDS = ("id", "modifiedDate", "products")
+
+_caches: Dict[str, "BomCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def parse_bom_components(bom_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Convert a v2/BomMasters response into the component list used for POs."""
+    out = []
+    for c in bom_data.get("products", []):
+        out.append({
+            "code": c.get("code"),
+            "qty": c.get("quantity", 1),
+            "unitCost": c.get("unitCost", 0)
+        })
+    return out
+
+
+class BomCache:
+    """SQLite-backed BOM store with a modified-date check against Cin7."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_age: int = DEFAULT_MAX_AGE):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: Location of the SQLite file
+            max_age: Seconds before a cached entry is re-validated
+        """
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            # WAL lets several app processes read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS boms ("
+                " code TEXT PRIMARY KEY,"
+                " bom_id INTEGER,"
+                " modified TEXT,"
+                " components TEXT NOT NULL,"
+                " checked_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for a code, or None if it was never fetched."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bom_id, modified, components, checked_at FROM boms WHERE code = ?",
+                (code,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "bom_id": row[0],
+            "modified": row[1],
+            "components": json.loads(row[2]),
+            "checked_at": row[3],
+        }
+
+    def put(self, code: str, bom_id: Optional[int], modified: Optional[str],
+            components: List[Dict[str, Any]]):
+        """Store a code's BOM. An empty component list records 'not a BOM'."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO boms (code, bom_id, modified, components, checked_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (code, bom_id, modified, json.dumps(components), time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, code: str):
+        """Mark an entry as freshly validated without changing its contents."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE boms SET checked_at = ? WHERE code = ?", (time.time(), code)
+            )
+            self._conn.commit()
+
+    def is_fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        """True if an entry was validated within max_age."""
+        return entry is not None and time.time() - entry["checked_at"] < self.max_age
+
+    def invalidate(self, codes: Optional[Iterable[str]] = None) -> int:
+        """
+        Drop cached BOMs so they are refetched on next use.
+
+        Args:
+            codes: Codes to drop, or None to clear the whole cache
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            if codes is None:
+                cur = self._conn.execute("DELETE FROM boms")
+            else:
+                cur = self._conn.executemany(
+                    "DELETE FROM boms WHERE code = ?", [(c,) for c in codes]
+                )
+            self._conn.commit()
+            return cur.rowcount
+
+    def count(self) -> int:
+        """Number of codes currently cached (BOMs and known non-BOMs)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM boms").fetchone()[0]
+
+    def lookup(self, code: str, cin7_get: Callable) -> List[Dict[str, Any]]:
+        """
+        Return a code's BOM components, going to Cin7 only when needed.
+
+        Args:
+            code: Product code to expand
+            cin7_get: The app's Cin7 GET helper
+
+        Returns:
+            List of components, or [] if the code is not a BOM
+        """
+        return self.lookup_many([code], cin7_get).get(code, [])
+
+    def lookup_many(self, codes: Iterable[str], cin7_get: Callable,
+                    max_workers: int = 4) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Resolve many codes with as few Cin7 calls as possible.
+
+        Fresh entries come from disk. The rest are looked up with batched
+        v1/BomMasters searches (see cin7_client.chunk_values). Stale entries
+        whose BOM id and modifiedDate are unchanged are kept; v2 details are
+        fetched concurrently only for codes that are new or changed BOMs.
+
+        Args:
+            codes: Product codes to expand (duplicates and blanks ignored)
+            cin7_get: The app's Cin7 GET helper
+            max_workers: Max Cin7 requests in flight
+
+        Returns:
+            Dictionary of code to components ([] when not a BOM)
+
+        Raises:
+            Cin7Error: A lookup failed for a code with nothing cached to fall back on
+        """
+        unique = list(dict.fromkeys(c for c in codes if c))
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        entries = {}
+        pending = []
+        for code in unique:
+            entry = self.get(code)
+            if self.is_fresh(entry):
+                result[code] = entry["components"]
+            else:
+                entries[code] = entry
+                pending.append(code)
+
+        if not pending:
+            return result
+
+        workers = max(1, min(max_workers, len(pending)))
+        chunks = chunk_values("code", pending)
+
+        def search(chunk):
+            try:
+                return list(paginate(cin7_get, "v1/BomMasters", params={"where": where_any("code", chunk)},
+                                     fields=BOM_HEADER_FIELDS))
+            except Cin7Error as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            searches = list(pool.map(search, chunks))
+
+        # Match headers back to the requested codes (Cin7 codes are case-insensitive)
+        by_upper = {c.upper(): c for c in pending}
+        headers: Dict[str, Dict[str, Any]] = {}
+        failed: Dict[str, Optional[Cin7Error]] = {}
+        for chunk, found in zip(chunks, searches):
+            if found is None or isinstance(found, Cin7Error):
+                failed.update((c, found) for c in chunk)
+                continue
+            for h in found:
+                code = by_upper.get(str(h.get("code") or "").upper())
+                if code and h.get("id") and code not in headers:
+                    headers[code] = h
+
+        to_fetch = []
+        for code in pending:
+            entry = entries[code]
+            if code in failed:
+                # Cin7 unavailable: serve stale data rather than caching a false miss
+                if entry is None and failed[code] is not None:
+                    raise failed[code]
+                result[code] = entry["components"] if entry else []
+                continue
+            header = headers.get(code)
+            if header is None:
+                self.put(code, None, None, [])
+                result[code] = []
+                continue
+            modified = header.get("modifiedDate")
+            if entry and modified and entry["bom_id"] == header["id"] and entry["modified"] == modified:
+                self.touch(code)
+                result[code] = entry["components"]
+                continue
+            to_fetch.append(code)
+
+        def detail(code):
+            try:
+                return cin7_get(f"v2/BomMasters/{headers[code]['id']}", fields=BOM_DETAIL_FIELDS)
+            except Cin7Error as e:
+                return e
+
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_fetch)))) as pool:
+                details = list(pool.map(detail, to_fetch))
+            for code, bom_data in zip(to_fetch, details):
+                entry = entries[code]
+                if isinstance(bom_data, Cin7Error) and entry is None:
+                    raise bom_data
+                if not bom_data or isinstance(bom_data, Cin7Error):
+                    result[code] = entry["components"] if entry else []
+                    continue
+                components = parse_bom_components(bom_data)
+                self.put(code, headers[code]["id"], headers[code].get("modifiedDate"), components)
+                result[code] = components
+
+        return result
+
+
+def get_bom_cache(path: str = DEFAULT_CACHE_PATH, max_age: int = DEFAULT_MAX_AGE) -> BomCache:
+    """
+    Get the process-wide cache for a path, creating it on first use.
+
+    Args:
+        path: Location of the SQLite file
+        max_age: Seconds before a cached entry is re-validated (only used on first call)
+
+    Returns:
+        Shared BomCache instance
+    """
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = BomCache(path, max_age)
+        return cache
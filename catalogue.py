@@ -0,0 +1,122 @@
+"""
+Product Catalogue Helpers
+Indexing and lookup of the product catalogue (Products.csv / Google Sheet),
+shared by the app variants.
+"""
+
+from typing import Any, Dict, Iterable, List
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:  # optional: catalogue text stays as object strings
+    STRING_DTYPE = object
+
+# Catalogue columns copied onto order lines when present
+LOOKUP_COLUMNS = ["Supplier", "Contact ID", "Supplier Code", "Product Name"]
+
+ORDER_LINE_COLUMNS = ["Item Code", "Item Name", "Qty", "Cost"]
+
+
+def compact_products(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a loaded catalogue to compact dtypes.
+
+    Supplier (a few hundred distinct names over many rows) becomes
+    categorical, Contact ID a nullable Int64 (blank or non-integer IDs become
+    <NA>), and other text columns arrow-backed strings when pyarrow is
+    installed. Missing text is stored as "" so equality filters never hit NA.
+
+    Args:
+        df: Catalogue as loaded from Sheets, CSV or the product store
+
+    Returns:
+        New DataFrame with the same columns and compact dtypes
+    """
+    out = {}
+    for col in df.columns:
+        values = df[col]
+        if col == "Contact ID":
+            ids = pd.to_numeric(values, errors="coerce")
+            out[col] = ids.where(ids % 1 == 0).astype("Int64")
+        elif col == "Supplier":
+            out[col] = values.fillna("").astype(str).str.strip().astype("category")
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            out[col] = values.fillna("").astype(str).astype(STRING_DTYPE)
+        else:
+            out[col] = values
+    return pd.DataFrame(out, index=df.index)
+
+
+def index_products(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Index the catalogue by Code for O(1) lookups and vectorised joins.
+
+    The first row wins when a code appears more than once, matching the
+    old `df[df["Code"] == code].iloc[0]` behaviour. The number of dropped
+    duplicates is kept in `df.attrs["duplicate_codes"]`, and
+    `df.attrs["indexed_by_code"]` marks the frame for lookups that use the
+    index (the index dtype varies with pandas version and compact_products,
+    so it can't be used to detect this).
+
+    Args:
+        df: Catalogue with a normalised (upper-case, stripped) Code column
+
+    Returns:
+        Catalogue with a unique Code index (Code is also kept as a column)
+    """
+    dupes = df["Code"].duplicated(keep="first")
+    indexed = df[~dupes].set_index("Code", drop=False, verify_integrity=True)
+    indexed.index.name = None
+    indexed.attrs["duplicate_codes"] = int(dupes.sum())
+    indexed.attrs["indexed_by_code"] = True
+    return indexed
+
+
+def join_products(lines: pd.DataFrame, products: pd.DataFrame,
+                  code_column: str = "Item Code", how: str = "inner") -> pd.DataFrame:
+    """
+    Attach catalogue columns to order lines in one join.
+
+    Args:
+        lines: Order lines with a normalised code column
+        products: Catalogue returned by index_products
+        code_column: Column in `lines` holding the product code
+        how: 'inner' to drop lines not in the catalogue, 'left' to keep them
+
+    Returns:
+        Lines (in their original order) with the LOOKUP_COLUMNS that exist
+        in the catalogue added
+    """
+    cols: List[str] = [c for c in LOOKUP_COLUMNS if c in products.columns and c not in lines.columns]
+    joined = lines.join(products[cols], on=code_column, how=how)
+    # Order lines are small and edited in Step 2, so give them plain columns
+    # back (a categorical Supplier would only accept existing suppliers)
+    for col in cols:
+        if isinstance(joined[col].dtype, pd.CategoricalDtype):
+            joined[col] = joined[col].astype(object)
+    return joined
+
+
+def sales_order_lines(line_items: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Flatten Cin7 sales-order lineItems into a frame ready for join_products.
+
+    Lines without a product (productId 0, e.g. notes and headings) are skipped
+    and codes are normalised to match the catalogue's Code column.
+
+    Args:
+        line_items: The `lineItems` list of a v1/SalesOrders record
+
+    Returns:
+        DataFrame with Item Code, Item Name, Qty and Cost columns
+    """
+    records = [
+        ((li.get("code", "") or "").upper().strip(), li.get("name", ""),
+         li.get("qty", 0), li.get("unitCost", 0))
+        for li in line_items
+        if li.get("productId", 0) != 0
+    ]
+    return pd.DataFrame.from_records(records, columns=ORDER_LINE_COLUMNS)
@@ -0,0 +1,182 @@
+"""
+Catalogue Snapshot Module
+Versioned local snapshots of the product catalogue. Every successful
+Google Sheets load is written to disk (Parquet when pyarrow is installed,
+pickle otherwise), so a cold start can serve the last good catalogue
+immediately and refresh from Sheets in the background.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    SNAPSHOT_FORMAT = "parquet"
+except ImportError:  # optional: fall back to pandas' own pickle format
+    SNAPSHOT_FORMAT = "pkl"
+
+# Override with the CATALOGUE_SNAPSHOT_DIR environment variable (e.g. a mounted volume)
+DEFAULT_SNAPSHOT_DIR = os.environ.get(
+    "CATALOGUE_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogue_snapshots")
+)
+
+# Snapshots kept on disk (newest first); older ones are deleted
+KEEP_VERSIONS = 3
+
+# Seconds after a failed background refresh before another is started
+RETRY_AFTER = 60
+
+_refresh_lock = threading.Lock()
+_last_failure = 0.0
+
+
+def _manifests(directory: str) -> List[str]:
+    """Snapshot manifest paths, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = [n for n in os.listdir(directory) if n.startswith("products-") and n.endswith(".json")]
+    return [os.path.join(directory, n) for n in sorted(names, reverse=True)]
+
+
+def save_snapshot(df: pd.DataFrame, sheet_version: Optional[str] = None,
+                  directory: str = DEFAULT_SNAPSHOT_DIR) -> str:
+    """
+    Write a catalogue snapshot and prune old versions.
+
+    The data file is written first and the small JSON manifest last (both
+    via rename), so readers only ever see complete snapshots.
+
+    Args:
+        df: Catalogue frame (compact dtypes are preserved in Parquet)
+        sheet_version: Drive version of the sheet it came from, if known
+        directory: Where snapshots are kept
+
+    Returns:
+        Path of the data file
+    """
+    os.makedirs(directory, exist_ok=True)
+    saved_at = time.time()
+    stem = os.path.join(directory, f"products-{int(saved_at * 1000):015d}")
+    data_path = f"{stem}.{SNAPSHOT_FORMAT}"
+
+    frame = df.reset_index(drop=True)
+    if SNAPSHOT_FORMAT == "parquet":
+        frame.to_parquet(data_path + ".tmp", index=False)
+    else:
+        frame.to_pickle(data_path + ".tmp")
+    os.replace(data_path + ".tmp", data_path)
+
+    manifest = {"data": os.path.basename(data_path), "saved_at": saved_at,
+                "sheet_version": sheet_version, "rows": len(frame)}
+    with open(stem + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(stem + ".json.tmp", stem + ".json")
+
+    for old in _manifests(directory)[KEEP_VERSIONS:]:
+        try:
+            with open(old, encoding="utf-8") as f:
+                old_data = json.load(f).get("data", "")
+            if old_data:
+                os.remove(os.path.join(directory, old_data))
+            os.remove(old)
+        except (OSError, ValueError):
+            pass
+    return data_path
+
+
+def latest_snapshot_info(directory: str = DEFAULT_SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+    """Manifest of the newest snapshot (data, saved_at, sheet_version, rows), or None."""
+    for path in _manifests(directory):
+        try:
+            with open(path, encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if os.path.exists(os.path.join(directory, info.get("data", ""))):
+            return info
+    return None
+
+
+def load_latest_snapshot(directory: str = DEFAULT_SNAPSHOT_DIR
+                         ) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """
+    Read the newest readable snapshot.
+
+    Returns:
+        (catalogue frame, manifest), or None if there is no usable snapshot
+    """
+    for path in _manifests(directory):
+        try:
+            with open(path, encoding="utf-8") as f:
+                info = json.load(f)
+            data_path = os.path.join(directory, info["data"])
+            if data_path.endswith(".parquet"):
+                df = pd.read_parquet(data_path)
+            else:
+                df = pd.read_pickle(data_path)
+        except Exception:
+            # Corrupt, partially pruned, or written by a build without pyarrow
+            continue
+        return df, info
+    return None
+
+
+def snapshot_age(info: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Seconds since a snapshot was saved."""
+    return time.time() - info["saved_at"] if info else None
+
+
+def is_stale(info: Dict[str, Any], sheet_version: Optional[str] = None,
+             max_age: float = 6 * 3600) -> bool:
+    """
+    Whether a snapshot should be refreshed.
+
+    Args:
+        info: Snapshot manifest
+        sheet_version: Current Drive version of the sheet; when unknown,
+            the snapshot's age is compared with max_age instead
+        max_age: Seconds an unversioned snapshot is served before refreshing
+    """
+    if sheet_version is not None:
+        return info.get("sheet_version") != sheet_version
+    return snapshot_age(info) > max_age
+
+
+def refresh_in_background(refresh: Callable[[], Any]) -> bool:
+    """
+    Run a catalogue refresh on a daemon thread unless one is already running.
+
+    Call it on every rerun while the snapshot is stale: after a failure,
+    the next call that is more than RETRY_AFTER seconds later tries again.
+
+    Args:
+        refresh: Downloads the catalogue and saves a new snapshot
+
+    Returns:
+        True if a refresh was started
+    """
+    if time.time() - _last_failure < RETRY_AFTER:
+        return False
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        global _last_failure
+        try:
+            refresh()
+        except BaseException as e:
+            # Includes Streamlit's StopException from st.stop(); the current
+            # snapshot keeps being served and a later rerun retries
+            _last_failure = time.time()
+            print(f"Background catalogue refresh failed: {e!r}")
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=run, name="catalogue-refresh", daemon=True).start()
+    return True
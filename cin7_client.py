@@ -0,0 +1,540 @@
+"""
+Cin7 API Client Module
+One pooled, keep-alive HTTP session per process for every Cin7 call,
+shared by all app variants and Streamlit sessions.
+
+Requests are paced by client-side token buckets matched to Cin7's API
+limits, and throttled or transient failures are retried with jittered
+exponential backoff (honouring Retry-After). Failures surface as typed
+Cin7Error subclasses instead of a bare None.
+
+Large responses can be decoded item by item with iter_items (uses ijson
+when installed, otherwise falls back to a full decode), and list endpoints
+are walked page by page with paginate.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+try:
+    import ijson
+except ImportError:  # optional: streaming falls back to r.json()
+    ijson = None
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 30)
+POST_TIMEOUT = (10, 60)
+
+# Connections kept open to Cin7; keep >= the largest worker pool using the client
+DEFAULT_POOL_SIZE = 10
+
+# Cin7 Omni API limits: 3 calls per second and 60 calls per minute
+DEFAULT_RATE_PER_SECOND = 3
+DEFAULT_RATE_PER_MINUTE = 60
+
+# Retry policy
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+# Longest Retry-After honoured; asking for more fails fast instead of
+# parking a worker (PO job, BOM lookup, journal claim) for that long
+RETRY_AFTER_CAP = 60.0
+GET_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A POST that hit 502/504 may still have been processed, so only retry
+# statuses where Cin7 rejected the request outright
+POST_RETRY_STATUSES = {429, 503}
+
+# Batched where-clause lookups: values per request and max clause length,
+# keeping the query string well under typical URL limits
+MAX_VALUES_PER_QUERY = 50
+MAX_WHERE_LENGTH = 1500
+
+# Rows per page on v1 list endpoints (Cin7's maximum)
+PAGE_SIZE = 250
+
+_clients: Dict[Tuple[str, str], "Cin7Client"] = {}
+_clients_lock = threading.Lock()
+
+
+def where_any(field: str, values: List[str]) -> str:
+    """Build an OR'd where clause matching any of the values, e.g. code='A' OR code='B'."""
+    return " OR ".join("{}='{}'".format(field, str(v).replace("'", "''")) for v in values)
+
+
+def chunk_values(field: str, values: List[str], max_values: int = MAX_VALUES_PER_QUERY,
+                 max_length: int = MAX_WHERE_LENGTH) -> List[List[str]]:
+    """
+    Split values into groups whose where_any clause fits in one request.
+
+    Args:
+        field: Field the clause filters on
+        values: Values to search for
+        max_values: Max values per group
+        max_length: Max characters of the group's where clause
+
+    Returns:
+        List of value groups, one per request
+    """
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    for value in values:
+        if current and (len(current) >= max_values
+                        or len(where_any(field, current + [value])) > max_length):
+            chunks.append(current)
+            current = []
+        current.append(value)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def field_list(fields: Union[str, Iterable[str]]) -> str:
+    """Format a field selection for Cin7's `fields` parameter, e.g. id,code,modifiedDate."""
+    if isinstance(fields, str):
+        return fields
+    return ",".join(dict.fromkeys(fields))
+
+
+def paginate(get: Callable, endpoint: str, params: Optional[Dict[str, Any]] = None,
+             fields: Optional[Union[str, Iterable[str]]] = None,
+             rows: int = PAGE_SIZE, prefetch: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every record of a v1 list endpoint, fetching pages as needed.
+
+    Pages are requested lazily, so a caller that stops early (e.g. after the
+    first match) never pays for the remaining pages. A page shorter than
+    `rows` is the last one. Pass an `order` param for a stable page order
+    when the data may change during the walk.
+
+    Args:
+        get: A Cin7 GET callable, e.g. Cin7Client.get or the app's cin7_get
+        endpoint: List endpoint, e.g. v1/SalesOrders
+        params: Query parameters (where, order, ...); page/rows are set here
+        fields: Top-level fields to return
+        rows: Records per page
+        prefetch: Extra pages requested ahead concurrently once the first page
+            comes back full (0 = one at a time); at most this many requests
+            are wasted past the last page
+
+    Yields:
+        Records in page order
+
+    Raises:
+        Cin7Error: A page request failed
+    """
+    base = dict(params or {}, rows=rows)
+
+    def fetch(page: int) -> List[Dict[str, Any]]:
+        return get(endpoint, params=dict(base, page=page), fields=fields) or []
+
+    # The first page is always fetched alone, so small results (the common
+    # case for incremental syncs) never pay for prefetched empty pages
+    records = fetch(1)
+    yield from records
+    if len(records) < rows:
+        return
+
+    if prefetch <= 0:
+        page = 2
+        while True:
+            records = fetch(page)
+            yield from records
+            if len(records) < rows:
+                return
+            page += 1
+
+    pool = ThreadPoolExecutor(max_workers=prefetch + 1, thread_name_prefix="cin7-page")
+    try:
+        pending = deque(pool.submit(fetch, page) for page in range(2, prefetch + 3))
+        next_page = prefetch + 3
+        while pending:
+            records = pending.popleft().result()
+            yield from records
+            if len(records) < rows:
+                return
+            pending.append(pool.submit(fetch, next_page))
+            next_page += 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def paginate_items(iter_get: Callable, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                   fields: Optional[Union[str, Iterable[str]]] = None,
+                   rows: int = PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Like paginate, but each page is streamed record by record.
+
+    Pages go through a streaming GET (Cin7Client.iter_items or the app's
+    cin7_iter), so a page is never decoded as one document: only the
+    current record is held, and a caller that stops early stops reading
+    the response too.
+
+    Args:
+        iter_get: A streaming Cin7 GET callable taking (endpoint, prefix, params, fields)
+        endpoint: List endpoint, e.g. v1/SalesOrders
+        params: Query parameters (where, order, ...); page/rows are set here
+        fields: Top-level fields to return
+        rows: Records per page
+
+    Yields:
+        Records in page order
+
+    Raises:
+        Cin7Error: A page request failed or was cut off
+    """
+    base = dict(params or {}, rows=rows)
+    page = 1
+    while True:
+        count = 0
+        for record in iter_get(endpoint, prefix="item", params=dict(base, page=page), fields=fields):
+            count += 1
+            yield record
+        if count < rows:
+            return
+        page += 1
+
+
+def _walk(obj: Any, prefix: str) -> Iterator[Any]:
+    """Yield the values at an ijson-style prefix (e.g. lineItems.item) of a decoded document."""
+    parts = prefix.split(".") if prefix else []
+
+    def walk(node, depth):
+        if depth == len(parts):
+            yield node
+        elif parts[depth] == "item":
+            if isinstance(node, list):
+                for child in node:
+                    yield from walk(child, depth + 1)
+        elif isinstance(node, dict) and parts[depth] in node:
+            yield from walk(node[parts[depth]], depth + 1)
+
+    return walk(obj, 0)
+
+
+class Cin7Error(Exception):
+    """A Cin7 request failed (as opposed to returning no results)."""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 endpoint: str = "", body: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.endpoint = endpoint
+        self.body = body
+
+
+class Cin7ConnectionError(Cin7Error):
+    """Cin7 could not be reached or timed out."""
+
+
+class Cin7AuthError(Cin7Error):
+    """Cin7 rejected the API credentials (401/403)."""
+
+
+class Cin7RateLimitError(Cin7Error):
+    """Cin7 kept returning 429 after all retries."""
+
+
+class Cin7ServerError(Cin7Error):
+    """Cin7 kept returning 5xx after all retries."""
+
+
+class Cin7RequestError(Cin7Error):
+    """Cin7 rejected the request itself (other 4xx)."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `capacity` calls per `period` seconds."""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take one token, sleeping until one is available.
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds."""
+    value = r.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_for(r: requests.Response, endpoint: str) -> Cin7Error:
+    """Build the typed error for a failed response."""
+    status = r.status_code
+    message = f"Cin7 {endpoint} returned HTTP {status}"
+    if status in (401, 403):
+        cls = Cin7AuthError
+    elif status == 429:
+        cls = Cin7RateLimitError
+    elif status >= 500:
+        cls = Cin7ServerError
+    else:
+        cls = Cin7RequestError
+    return cls(message, status=status, endpoint=endpoint, body=r.text[:500])
+
+
+class Cin7Client:
+    """Pooled requests.Session with auth, timeouts, rate limiting and retries."""
+
+    def __init__(self, base_url: str, api_username: str, api_key: str,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 rate_per_second: int = DEFAULT_RATE_PER_SECOND,
+                 rate_per_minute: int = DEFAULT_RATE_PER_MINUTE):
+        """
+        Create the session and mount a sized connection pool.
+
+        Args:
+            base_url: Cin7 API root, e.g. https://api.cin7.com/api
+            api_username: Cin7 API username
+            api_key: Cin7 API key
+            pool_size: Max keep-alive connections held open to Cin7
+            rate_per_second: Max calls started per second
+            rate_per_minute: Max calls started per minute
+        """
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(api_username, api_key)
+        self.session.headers.update({"Accept": "application/json"})
+
+        # pool_block=True makes extra threads wait for a free connection
+        # instead of opening (and then discarding) new ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.buckets: List[TokenBucket] = [
+            TokenBucket(rate_per_second, 1.0),
+            TokenBucket(rate_per_minute, 60.0),
+        ]
+
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "wait_seconds": 0.0}
+
+    def _count(self, key: str, amount: float = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _throttle(self):
+        waited = sum(bucket.acquire() for bucket in self.buckets)
+        if waited:
+            self._count("wait_seconds", waited)
+
+    def _backoff(self, attempt: int, delay: Optional[float] = None):
+        if delay is None:
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+        self._count("retries")
+        self._count("wait_seconds", delay)
+        time.sleep(delay)
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """
+        Send a request relative to base_url with pacing and retries.
+
+        Returns the final response for any status that is not retried
+        (including 4xx), so callers decide what counts as an error.
+
+        Raises:
+            Cin7ConnectionError: Network failure or timeout after all retries
+            Cin7RateLimitError: Still throttled (429) after all retries, or
+                told to wait longer than RETRY_AFTER_CAP
+            Cin7ServerError: Still failing (5xx) after all retries, or told
+                to wait longer than RETRY_AFTER_CAP
+        """
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        is_get = method.upper() == "GET"
+        retry_statuses = GET_RETRY_STATUSES if is_get else POST_RETRY_STATUSES
+
+        attempt = 0
+        while True:
+            self._throttle()
+            self._count("requests")
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A POST may have reached Cin7 unless the connect itself failed
+                retryable = is_get or isinstance(e, requests.exceptions.ConnectTimeout)
+                if retryable and attempt < MAX_RETRIES:
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+                raise Cin7ConnectionError(
+                    f"Could not reach Cin7 {endpoint}: {e}", endpoint=endpoint
+                ) from e
+
+            if r.status_code == 429:
+                self._count("throttled")
+            if r.status_code in retry_statuses and attempt < MAX_RETRIES:
+                delay = _retry_after(r)
+                if delay is not None and delay > RETRY_AFTER_CAP:
+                    raise _error_for(r, endpoint)
+                # Release the connection (matters for stream=True requests)
+                r.close()
+                self._backoff(attempt, delay)
+                attempt += 1
+                continue
+            if r.status_code in retry_statuses:
+                raise _error_for(r, endpoint)
+            return r
+
+    def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None,
+            fields: Optional[Union[str, Iterable[str]]] = None) -> Optional[Any]:
+        """
+        GET an endpoint and decode the JSON body.
+
+        Args:
+            endpoint: Path relative to base_url, e.g. v1/SalesOrders
+            params: Query parameters
+            fields: Top-level fields to return (Cin7 `fields` projection);
+                None returns full objects
+
+        Returns:
+            Parsed JSON on HTTP 200, or None if Cin7 says 404 Not Found
+
+        Raises:
+            Cin7Error: Any other failure (see request for subclasses)
+        """
+        if fields:
+            params = dict(params or {}, fields=field_list(fields))
+        r = self.request("GET", endpoint, params=params)
+        if r.status_code == 200:
+            return r.json()
+        if r.status_code == 404:
+            return None
+        raise _error_for(r, endpoint)
+
+    def iter_items(self, endpoint: str, prefix: str = "item",
+                   params: Optional[Dict[str, Any]] = None,
+                   fields: Optional[Union[str, Iterable[str]]] = None) -> Iterator[Any]:
+        """
+        GET an endpoint and yield the values at `prefix` as they are decoded.
+
+        With ijson installed the body is parsed straight off the socket, so
+        only one item is held at a time however large the response is.
+
+        Args:
+            endpoint: Path relative to base_url
+            prefix: ijson prefix, e.g. item (top-level list) or lineItems.item
+            params: Query parameters
+            fields: Top-level fields to return
+
+        Yields:
+            Decoded items; nothing on 404
+
+        Raises:
+            Cin7Error: The request failed (see request for subclasses)
+        """
+        if fields:
+            params = dict(params or {}, fields=field_list(fields))
+        r = self.request("GET", endpoint, params=params, stream=True)
+        try:
+            if r.status_code == 404:
+                return
+            if r.status_code != 200:
+                raise _error_for(r, endpoint)
+            if ijson is None:
+                yield from _walk(r.json(), prefix)
+                return
+            r.raw.decode_content = True
+            try:
+                yield from ijson.items(r.raw, prefix, use_float=True)
+            except Exception as e:
+                # Dropped connection, read timeout or truncated JSON mid-stream
+                raise Cin7ConnectionError(
+                    f"Cin7 {endpoint} response was cut off: {e}", endpoint=endpoint
+                ) from e
+        finally:
+            r.close()
+
+    def post(self, endpoint: str, payload: Any) -> Tuple[int, str]:
+        """
+        POST a JSON payload.
+
+        Returns:
+            Tuple of (status code, response text); validation failures (4xx)
+            are returned rather than raised so the caller can show them
+
+        Raises:
+            Cin7Error: Connection failure, or still throttled/unavailable after retries
+        """
+        r = self.request("POST", endpoint, json=payload, timeout=POST_TIMEOUT)
+        if r.status_code in (401, 403):
+            raise _error_for(r, endpoint)
+        return r.status_code, r.text
+
+    def stats_snapshot(self) -> Dict[str, float]:
+        """Copy of the request/retry counters for display."""
+        with self._stats_lock:
+            return dict(self.stats)
+
+
+def get_cin7_client(base_url: str, api_username: str, api_key: str,
+                    pool_size: int = DEFAULT_POOL_SIZE,
+                    rate_per_second: int = DEFAULT_RATE_PER_SECOND,
+                    rate_per_minute: int = DEFAULT_RATE_PER_MINUTE) -> Cin7Client:
+    """
+    Get the process-wide client for a Cin7 account, creating it on first use.
+
+    The rate limit is per account, so every session and app variant in the
+    process must share one client (and therefore one set of buckets).
+
+    Args:
+        base_url: Cin7 API root
+        api_username: Cin7 API username
+        api_key: Cin7 API key
+        pool_size: Max keep-alive connections (only used on first call)
+        rate_per_second: Max calls per second (only used on first call)
+        rate_per_minute: Max calls per minute (only used on first call)
+
+    Returns:
+        Shared Cin7Client instance
+    """
+    key = (base_url.rstrip("/"), api_username)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = Cin7Client(
+                base_url, api_username, api_key, pool_size,
+                rate_per_second, rate_per_minute
+            )
+        return client
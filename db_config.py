@@ -3,6 +3,9 @@ Database Configuration for Cin7 PO Wizard
 Uses Google Sheets as the backend for storing Cin7 product data
 """
 
+import threading
+from typing import Optional
+
 import streamlit as st
 from gsheets_db import GoogleSheetsDatabase
 
@@ -10,24 +13,38 @@ from gsheets_db import GoogleSheetsDatabase
 PRODUCT_SPREADSHEET_NAME = "Cin7 Products Database"
 PRODUCT_WORKSHEET_NAME = "products"
 
+# Process-wide connection, shared by every session and worker thread.
+# Created on first use so importing this module never touches Google.
+_product_db: Optional[GoogleSheetsDatabase] = None
+_product_db_lock = threading.Lock()
+
 
 def get_product_database():
     """
     Get the product database instance (Google Sheets).
 
+    The first call authorises and opens the worksheet; later calls reuse
+    that connection (and its snapshot cache). A failed connect is not
+    cached, so the next call tries again.
+
     Returns:
         GoogleSheetsDatabase instance connected to the products sheet
     """
-    try:
-        db = GoogleSheetsDatabase(
-            spreadsheet_name=PRODUCT_SPREADSHEET_NAME,
-            worksheet_name=PRODUCT_WORKSHEET_NAME
-        )
-        return db
-    except Exception as e:
-        st.error(f"Failed to connect to product database: {str(e)}")
-        st.info("Make sure you've:")
-        st.code("1. Created Google Cloud credentials\n"
-                "2. Added them to Streamlit secrets or created credentials.json\n"
-                "3. Shared the spreadsheet with your service account")
-        return None
+    global _product_db
+    with _product_db_lock:
+        if _product_db is not None:
+            return _product_db
+        try:
+            _product_db = GoogleSheetsDatabase(
+                spreadsheet_name=PRODUCT_SPREADSHEET_NAME,
+                worksheet_name=PRODUCT_WORKSHEET_NAME
+            )
+            return _product_db
+        except Exception as e:
+            st.error(f"Failed to connect to product database: {str(e)}")
+            st.info("Make sure you've:")
+            st.code("1. Created Google Cloud credentials\n"
+                    "2. Added them to Streamlit secrets or created credentials.json\n"
+                    "3. Shared the spreadsheet with your service account")
+            return None
+
@@ -1,6 +1,8 @@
 """
 Google Sheets Product Data Integration
-Fetches product data from Google Sheets and provides lookup functions
+Fetches product data from Google Sheets and provides lookup functions.
+The sheet is only re-downloaded when its Drive version changes (see
+sheet_version), so callers can check often and reload rarely.
 """
 
 import pandas as pd
@@ -8,6 +10,8 @@ import gspread
 from google.oauth2.service_account import Credentials
 import streamlit as st
 
+from sheet_ranges import read_columns
+
 # Google Sheets configuration
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
@@ -18,13 +22,72 @@ SCOPES = [
 # Get it from the URL: https://docs.google.com/spreadsheets/d/[SHEET_ID]/edit
 DEFAULT_SHEET_ID = "1cKoXDL4BjoiyU__jM67jwZaBodYB6bkbwPETwmuLQVU"
 
+# How often the sheet's Drive version is checked (one small metadata call)
+VERSION_CHECK_TTL = 300
+
+# A downloaded catalogue is kept this long even if no change is detected
+# (also the refresh interval for published sheets, which can't be checked)
+CATALOGUE_MAX_AGE = 6 * 3600
+
+DRIVE_FILE_URL = "https://www.googleapis.com/drive/v3/files/{}"
+
+
+@st.cache_resource
+def _sheets_client():
+    """One authorised gspread client per process (None without service account secrets)."""
+    if "google" not in st.secrets:
+        return None
+    # Convert Streamlit secrets to dict for Google API
+    creds = Credentials.from_service_account_info(dict(st.secrets["google"]), scopes=SCOPES)
+    return gspread.authorize(creds)
+
+
+@st.cache_data(ttl=VERSION_CHECK_TTL, show_spinner=False)
+def sheet_version(sheet_id=None):
+    """
+    Current Drive version of the products sheet.
+
+    Pass the result to load_products_from_sheets: the sheet is downloaded
+    again only when the version changes.
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def load_products_from_sheets(sheet_id=None):
+    Returns:
+        "version:modifiedTime" string, or None if it can't be checked
+        (published-sheet mode or a Drive error)
+    """
+    if sheet_id is None:
+        sheet_id = st.secrets.get("google_sheet_id", DEFAULT_SHEET_ID)
+    client = _sheets_client()
+    if client is None:
+        return None
+    try:
+        # gspread 6 moved request() onto client.http_client
+        http = getattr(client, "http_client", client)
+        meta = http.request(
+            "get", DRIVE_FILE_URL.format(sheet_id),
+            params={"fields": "version,modifiedTime", "supportsAllDrives": True}
+        ).json()
+    except Exception:
+        return None
+    return f"{meta.get('version', '')}:{meta.get('modifiedTime', '')}"
+
+
+def refresh_products_from_sheets():
+    """Forget the cached catalogue and version so the next load re-downloads the sheet."""
+    sheet_version.clear()
+    load_products_from_sheets.clear()
+
+
+@st.cache_data(ttl=CATALOGUE_MAX_AGE)
+def load_products_from_sheets(sheet_id=None, version=None, columns=None):
     """
     Load product data from Google Sheets
     Returns a pandas DataFrame with columns matching Products.csv:
     - Product Name, Style Code, Stock Control, Code, Supplier Code, Supplier, Contact ID
+
+    `version` (from sheet_version) is only part of the cache key: while it
+    is unchanged the parsed DataFrame is served without touching the sheet.
+    `columns` limits the download to those columns (fetched as column
+    ranges in one batch_get); None loads every column.
     """
     try:
         # Use provided sheet_id or get from secrets or use default
@@ -32,19 +95,18 @@ def load_products_from_sheets(sheet_id=None):
             sheet_id = st.secrets.get("google_sheet_id", DEFAULT_SHEET_ID)
 
         # Try to use service account credentials if available
-        if "google" in st.secrets:
-            # Convert Streamlit secrets to dict for Google API
-            google_creds = dict(st.secrets["google"])
-            creds = Credentials.from_service_account_info(
-                google_creds,
-                scopes=SCOPES
-            )
-            client = gspread.authorize(creds)
-
+        client = _sheets_client()
+        if client is not None:
             # Open the spreadsheet by ID
             sheet = client.open_by_key(sheet_id)
             worksheet = sheet.get_worksheet(0)  # First worksheet
 
+        if client is not None and columns:
+            # Only the requested columns (header row + one batch_get)
+            df = pd.DataFrame(read_columns(worksheet, columns))
+            if len(df.columns) and df.empty:
+                raise ValueError("Sheet appears to be empty or has no data rows")
+        elif client is not None:
             # Get all values from the worksheet
             # Using get_all_values() to handle duplicate column names
             all_values = worksheet.get_all_values()
@@ -62,7 +124,10 @@ def load_products_from_sheets(sheet_id=None):
             # Fallback: Try to read the published sheet directly
             # Note: This works only if the sheet is published to web
             csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv"
-            df = pd.read_csv(csv_url)
+            if columns:
+                df = pd.read_csv(csv_url, usecols=lambda c: c.strip() in columns)
+            else:
+                df = pd.read_csv(csv_url)
 
         # Clean up column names
         df.columns = [c.strip() for c in df.columns]
@@ -104,6 +169,13 @@ def get_product_by_code(df, code):
     Returns a dictionary with product details or None if not found
     """
     code = str(code).upper().strip()
+
+    # Fast path for catalogues indexed by catalogue.index_products
+    if df.attrs.get("indexed_by_code") and df.index.is_unique:
+        if code not in df.index:
+            return None
+        return df.loc[code].to_dict()
+
     result = df[df["Code"] == code]
 
     if result.empty:
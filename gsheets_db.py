@@ -6,27 +6,46 @@ Provides database operations using Google Sheets as the backend storage.
 import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 import json
 import os
+import threading
+import time
+
+from sheet_ranges import read_columns
+
+# Seconds a downloaded sheet snapshot is reused before read_all() refetches it
+DEFAULT_CACHE_TTL = 300
 
 
 class GoogleSheetsDatabase:
     """A Google Sheets-based database with basic CRUD operations."""
 
-    def __init__(self, spreadsheet_name: str = "SDATA Database", worksheet_name: str = "data"):
+    def __init__(self, spreadsheet_name: str = "SDATA Database", worksheet_name: str = "data",
+                 cache_ttl: int = DEFAULT_CACHE_TTL):
         """
         Initialize the Google Sheets database.
 
         Args:
             spreadsheet_name: Name of the Google Spreadsheet
             worksheet_name: Name of the worksheet/tab within the spreadsheet
+            cache_ttl: Seconds to reuse the downloaded sheet before refetching
         """
         self.spreadsheet_name = spreadsheet_name
         self.worksheet_name = worksheet_name
         self.client = None
         self.sheet = None
+        self.cache_ttl = cache_ttl
+
+        # In-memory snapshot of the sheet plus per-column value -> row positions
+        self._snapshot: Optional[pd.DataFrame] = None
+        self._snapshot_at = 0.0
+        self._indexes: Dict[str, Dict[Any, List[int]]] = {}
+        # Column-projected reads, keyed by column tuple: (fetched_at, frame)
+        self._projections: Dict[Tuple[str, ...], Tuple[float, pd.DataFrame]] = {}
+        self._cache_lock = threading.RLock()
+
         self._connect()
 
     def _connect(self):
@@ -86,17 +105,106 @@ class GoogleSheetsDatabase:
             print(f"Failed to connect to Google Sheets: {str(e)}")
             raise
 
-    def read_all(self) -> pd.DataFrame:
-        """Read all data from Google Sheets."""
-        try:
-            data = self.sheet.get_all_records()
+    def _load_snapshot(self) -> Optional[pd.DataFrame]:
+        """Return the cached sheet, downloading it if missing or older than cache_ttl."""
+        with self._cache_lock:
+            if self._snapshot is not None and time.time() - self._snapshot_at < self.cache_ttl:
+                return self._snapshot
+
+            try:
+                try:
+                    data = self.sheet.get_all_records()
+                except gspread.exceptions.APIError as e:
+                    if getattr(e.response, "status_code", None) != 401:
+                        raise
+                    # Long-lived shared instance: re-authorise and retry once
+                    self._connect()
+                    data = self.sheet.get_all_records()
+            except Exception as e:
+                print(f"Error reading from Google Sheets: {str(e)}")
+                return None
+
             if len(data) == 0:
-                # Return empty DataFrame with id and timestamp columns
-                return pd.DataFrame(columns=["id", "timestamp"])
-            return pd.DataFrame(data)
-        except Exception as e:
-            print(f"Error reading from Google Sheets: {str(e)}")
+                # Empty DataFrame with id and timestamp columns
+                df = pd.DataFrame(columns=["id", "timestamp"])
+            else:
+                df = pd.DataFrame(data)
+
+            self._snapshot = df
+            self._snapshot_at = time.time()
+            self._indexes = {}
+            return df
+
+    def _column_index(self, df: pd.DataFrame, column: str) -> Dict[Any, List[int]]:
+        """
+        Hash index of a snapshot column (value -> row positions), built on first use.
+
+        The index is only cached while `df` is still the current snapshot: if
+        another thread reloaded the sheet after the caller fetched `df`, the
+        positions belong to the old frame and must not be reused against the
+        new one.
+        """
+        with self._cache_lock:
+            current = df is self._snapshot
+            index = self._indexes.get(column) if current else None
+            if index is None:
+                index = {}
+                for pos, value in enumerate(df[column].tolist()):
+                    index.setdefault(value, []).append(pos)
+                if current:
+                    self._indexes[column] = index
+            return index
+
+    def invalidate(self):
+        """Drop the cached snapshot so the next read refetches the sheet."""
+        with self._cache_lock:
+            self._snapshot = None
+            self._snapshot_at = 0.0
+            self._indexes = {}
+            self._projections = {}
+
+    def _load_columns(self, columns: Tuple[str, ...]) -> Optional[pd.DataFrame]:
+        """Return only some columns, from the full snapshot if fresh, else via batch_get."""
+        with self._cache_lock:
+            now = time.time()
+            if self._snapshot is not None and now - self._snapshot_at < self.cache_ttl:
+                return self._snapshot[[c for c in columns if c in self._snapshot.columns]]
+            cached = self._projections.get(columns)
+            if cached is not None and now - cached[0] < self.cache_ttl:
+                return cached[1]
+
+            try:
+                try:
+                    data = read_columns(self.sheet, columns, numericise=True)
+                except gspread.exceptions.APIError as e:
+                    if getattr(e.response, "status_code", None) != 401:
+                        raise
+                    self._connect()
+                    data = read_columns(self.sheet, columns, numericise=True)
+            except Exception as e:
+                print(f"Error reading from Google Sheets: {str(e)}")
+                return None
+
+            df = pd.DataFrame(data)
+            self._projections[columns] = (now, df)
+            return df
+
+    def read_all(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Read all data from Google Sheets (served from the snapshot cache within cache_ttl).
+
+        Args:
+            columns: Only return these columns; on a cache miss only they are
+                downloaded. None returns every column.
+        """
+        if columns:
+            df = self._load_columns(tuple(dict.fromkeys(columns)))
+        else:
+            df = self._load_snapshot()
+        if df is None:
             return pd.DataFrame()
+        # Callers may modify the result, so never hand out the cached frame
+        return df.copy()
 
     def add_record(self, data: Dict) -> bool:
         """
@@ -109,7 +217,8 @@ class GoogleSheetsDatabase:
             True if successful, False otherwise
         """
         try:
-            df = self.read_all()
+            # Only the id column is needed to pick the next id
+            df = self.read_all(columns=["id"])
 
             # Auto-generate ID
             if len(df) == 0:
@@ -134,6 +243,7 @@ class GoogleSheetsDatabase:
 
             # Append the row
             self.sheet.append_row(row_data)
+            self.invalidate()
             return True
         except Exception as e:
             print(f"Error adding record: {str(e)}")
@@ -169,6 +279,7 @@ class GoogleSheetsDatabase:
                     col_num = headers.index(key) + 1
                     self.sheet.update_cell(row_num, col_num, value)
 
+            self.invalidate()
             return True
         except Exception as e:
             print(f"Error updating record: {str(e)}")
@@ -192,6 +303,7 @@ class GoogleSheetsDatabase:
                 return False
 
             self.sheet.delete_rows(cell.row)
+            self.invalidate()
             return True
         except Exception as e:
             print(f"Error deleting record: {str(e)}")
@@ -201,6 +313,9 @@ class GoogleSheetsDatabase:
         """
         Search for records matching a specific value in a column.
 
+        Uses the cached snapshot and a per-column hash index, so only the
+        first search after a load (or invalidate) touches Google Sheets.
+
         Args:
             column: Column name to search in
             value: Value to search for
@@ -209,16 +324,47 @@ class GoogleSheetsDatabase:
             DataFrame containing matching records
         """
         try:
-            df = self.read_all()
+            df = self._load_snapshot()
+            if df is None:
+                return pd.DataFrame()
             if column not in df.columns:
                 print(f"Column {column} not found")
                 return pd.DataFrame()
 
-            return df[df[column] == value]
+            positions = self._column_index(df, column).get(value, [])
+            return df.iloc[positions].copy()
         except Exception as e:
             print(f"Error searching: {str(e)}")
             return pd.DataFrame()
 
+    def lookup_many(self, column: str, values) -> Dict[Any, Dict]:
+        """
+        Look up many values in a column at once.
+
+        Args:
+            column: Column name to search in
+            values: Values to look up
+
+        Returns:
+            Dictionary of value to its first matching record; values with
+            no match are left out
+        """
+        try:
+            df = self._load_snapshot()
+            if df is None or column not in df.columns:
+                return {}
+
+            index = self._column_index(df, column)
+            hits = {v: index[v][0] for v in set(values) if v in index}
+            if not hits:
+                return {}
+
+            records = df.iloc[list(hits.values())].to_dict("records")
+            return dict(zip(hits.keys(), records))
+        except Exception as e:
+            print(f"Error looking up values: {str(e)}")
+            return {}
+
     def get_columns(self) -> List[str]:
         """Get list of all columns in the database."""
         try:
@@ -269,6 +415,7 @@ class GoogleSheetsDatabase:
                 values = df_import.values.tolist()
                 self.sheet.append_rows(values)
 
+            self.invalidate()
             return True
         except Exception as e:
             print(f"Error importing data: {str(e)}")
@@ -0,0 +1,291 @@
+"""
+PO Job Queue
+Runs PO builds (BOM expansion + push) on an in-process worker pool so the
+Streamlit script never blocks on Cin7. Job state and per-PO results are
+kept in SQLite, so progress can be polled across reruns. Each job records
+the app that submitted it and who submitted it, so panels only show (and
+re-run) their own jobs. Workers heartbeat their jobs; a job whose
+heartbeat stops is flagged as interrupted.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Override with the PO_JOBS_PATH environment variable (e.g. a mounted volume)
+DEFAULT_JOBS_PATH = os.environ.get(
+    "PO_JOBS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "po_jobs.sqlite")
+)
+
+# PO builds run at the same time; each one already fans out its own Cin7 calls
+DEFAULT_MAX_JOBS = 2
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# Seconds between worker heartbeats, and without one before a job is orphaned
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_COLUMNS = ["id", "qref", "state", "stage", "total", "results", "params", "error",
+            "owner", "app", "submitted_by", "created_at", "updated_at"]
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+
+_runners: Dict[Tuple[str, str], "JobRunner"] = {}
+_runners_lock = threading.Lock()
+
+
+class JobStore:
+    """SQLite table of PO jobs: state, stage, progress and per-PO results."""
+
+    def __init__(self, path: str = DEFAULT_JOBS_PATH):
+        """
+        Open (or create) the job database.
+
+        Args:
+            path: Location of the SQLite file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " qref TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " stage TEXT,"
+                " total INTEGER NOT NULL DEFAULT 0,"
+                " results TEXT NOT NULL DEFAULT '[]',"
+                " params TEXT NOT NULL,"
+                " error TEXT,"
+                " owner TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            # Databases created before jobs were scoped per app and submitter
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for col in ("app", "submitted_by"):
+                if col not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} TEXT NOT NULL DEFAULT ''")
+            self._conn.commit()
+        self.mark_orphans()
+
+    def mark_orphans(self) -> int:
+        """
+        Flag active jobs whose worker stopped heartbeating as interrupted.
+
+        Works across hosts and container restarts, where a host:pid check
+        would miss a rescheduled pod or see a reused PID as alive.
+
+        Returns:
+            Number of jobs flagged
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = ?, stage = ?, error = ?"
+                " WHERE state IN (?, ?) AND updated_at < ?",
+                (INTERRUPTED, "Stopped", "Worker process stopped; re-run to send the remaining POs",
+                 *ACTIVE_STATES, time.time() - STALE_AFTER)
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def create(self, qref: str, params: Dict[str, Any], app: str = "", submitted_by: str = "") -> str:
+        """Insert a queued job and return its id."""
+        job_id = uuid.uuid4().hex[:8]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, qref, state, stage, params, owner, app, submitted_by,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, qref, QUEUED, "Waiting for a worker", json.dumps(params), _OWNER,
+                 app, submitted_by, now, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def heartbeat(self, job_ids: Iterable[str]):
+        """Bump updated_at on jobs a live worker still holds."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *job_ids)
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields):
+        """Set columns (state, stage, total, error) on a job."""
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def append_result(self, job_id: str, result: Dict[str, Any]):
+        """Add one PO result to a job."""
+        with self._lock:
+            row = self._conn.execute("SELECT results FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            results = json.loads(row[0]) if row else []
+            results.append(result)
+            self._conn.execute(
+                "UPDATE jobs SET results = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(results, default=str), time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _row(self, row) -> Dict[str, Any]:
+        job = dict(zip(_COLUMNS, row))
+        job["results"] = json.loads(job["results"])
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job, or None."""
+        with self._lock:
+            row = self._conn.execute(f"{_SELECT} WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def recent(self, limit: int = 10, app: Optional[str] = None,
+               submitted_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Most recently created jobs first.
+
+        Orphaned jobs are flagged first, so the list never shows a dead
+        worker's job as still running.
+
+        Args:
+            limit: Max jobs returned
+            app: Only jobs submitted by this app variant
+            submitted_by: Only jobs submitted by this user or session
+        """
+        self.mark_orphans()
+        where, args = [], []
+        for col, value in (("app", app), ("submitted_by", submitted_by)):
+            if value is not None:
+                where.append(f"{col} = ?")
+                args.append(value)
+        sql = _SELECT + (f" WHERE {' AND '.join(where)}" if where else "")
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY created_at DESC LIMIT ?", (*args, limit)).fetchall()
+        return [self._row(r) for r in rows]
+
+
+class JobProgress:
+    """Handle a running job uses to report its stage and results."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    def stage(self, text: str):
+        self.store.update(self.job_id, stage=text)
+
+    def set_total(self, total: int):
+        self.store.update(self.job_id, total=total)
+
+    def add_result(self, result: Dict[str, Any]):
+        self.store.append_result(self.job_id, result)
+
+
+class JobRunner:
+    """In-process worker pool that runs submitted PO jobs for one app variant."""
+
+    def __init__(self, store: JobStore, max_workers: int = DEFAULT_MAX_JOBS, app: str = ""):
+        """
+        Args:
+            store: Job database
+            max_workers: Jobs run at the same time
+            app: App variant recorded on each job (e.g. "app", "podata")
+        """
+        self.store = store
+        self.app = app
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="po-job")
+        self._held = set()
+        self._held_lock = threading.Lock()
+        threading.Thread(target=self._heartbeat, name="po-job-heartbeat", daemon=True).start()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._held_lock:
+                held = list(self._held)
+            try:
+                self.store.heartbeat(held)
+            except sqlite3.Error:
+                # Missed beats are tolerated up to STALE_AFTER
+                pass
+
+    def submit(self, qref: str, fn: Callable, submitted_by: str = "", **params) -> str:
+        """
+        Queue a job.
+
+        Args:
+            qref: Quote/sales-order reference the job is for
+            fn: Called as fn(progress, qref, **params) on a worker thread
+            submitted_by: User or session the job belongs to
+            **params: JSON-serialisable arguments, stored so the job can be re-run
+
+        Returns:
+            Job id
+        """
+        job_id = self.store.create(qref, params, app=self.app, submitted_by=submitted_by)
+        with self._held_lock:
+            self._held.add(job_id)
+        self._pool.submit(self._run, job_id, fn, qref, params)
+        return job_id
+
+    def recent(self, limit: int = 10, submitted_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """This app's most recent jobs, optionally for one submitter."""
+        return self.store.recent(limit, app=self.app, submitted_by=submitted_by)
+
+    def _run(self, job_id: str, fn: Callable, qref: str, params: Dict[str, Any]):
+        try:
+            self.store.update(job_id, state=RUNNING, stage="Starting")
+            try:
+                fn(JobProgress(self.store, job_id), qref, **params)
+            except Exception as e:
+                self.store.update(job_id, state=FAILED, stage="Stopped", error=str(e))
+                return
+            self.store.update(job_id, state=DONE, stage="Finished")
+        finally:
+            with self._held_lock:
+                self._held.discard(job_id)
+
+
+def get_job_runner(path: str = DEFAULT_JOBS_PATH, max_workers: int = DEFAULT_MAX_JOBS,
+                   app: str = "") -> JobRunner:
+    """
+    Get the process-wide job runner for a path and app, creating it on first use.
+
+    Args:
+        path: Location of the SQLite file
+        max_workers: Jobs run at the same time (only used on first call)
+        app: App variant the runner submits jobs for
+
+    Returns:
+        Shared JobRunner instance
+    """
+    with _runners_lock:
+        runner = _runners.get((path, app))
+        if runner is None:
+            runner = _runners[(path, app)] = JobRunner(JobStore(path), max_workers, app)
+        return runner
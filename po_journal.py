@@ -0,0 +1,222 @@
+"""
+PO Submission Journal
+Write-ahead SQLite log of purchase-order submissions, keyed by PO reference
+(references are unique per supplier, see po_push.po_references) and storing
+a hash of the payload. A PO is claimed in the journal before it is
+POSTed and marked sent or failed afterwards, so reruns, double clicks and
+restarts after a crash never create the same PO twice. A claim stays
+held while its owner heartbeats it (see keep_claimed), however long the
+push takes. A PO deleted in Cin7 can be raised again once its entry is
+forgotten.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Override with the PO_JOURNAL_PATH environment variable (e.g. a mounted volume)
+DEFAULT_JOURNAL_PATH = os.environ.get(
+    "PO_JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "po_journal.sqlite")
+)
+
+# Seconds between heartbeats on held claims, and without one before a
+# 'pending' claim is assumed to belong to a crashed run
+CLAIM_HEARTBEAT_INTERVAL = 10
+IN_FLIGHT_TIMEOUT = 60
+
+# Submission states
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# Results of PoJournal.claim
+CLAIMED = "claimed"
+ALREADY_SENT = "already_sent"
+IN_FLIGHT = "in_flight"
+
+_journals: Dict[str, "PoJournal"] = {}
+_journals_lock = threading.Lock()
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Stable hash of a PO payload (key order does not matter)."""
+    blob = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class PoJournal:
+    """SQLite-backed record of which PO references have been submitted."""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        """
+        Open (or create) the journal database.
+
+        Args:
+            path: Location of the SQLite file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: transactions are managed explicitly in claim()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS submissions ("
+                " reference TEXT PRIMARY KEY,"
+                " payload_hash TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " cin7_id INTEGER,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " detail TEXT,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def get(self, reference: str) -> Optional[Dict[str, Any]]:
+        """Return the journal entry for a PO reference, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reference, payload_hash, state, cin7_id, attempts, detail, updated_at"
+                " FROM submissions WHERE reference = ?",
+                (reference,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["reference", "payload_hash", "state", "cin7_id", "attempts", "detail", "updated_at"]
+        return dict(zip(keys, row))
+
+    def claim(self, reference: str, digest: str) -> str:
+        """
+        Atomically reserve a PO reference for submission.
+
+        Args:
+            reference: PO reference, e.g. PO-Q19663E.S26ACME
+            digest: payload_hash of the payload about to be sent
+
+        Returns:
+            CLAIMED if the caller may submit it, ALREADY_SENT if it was
+            created before, or IN_FLIGHT if another run is submitting it now
+        """
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so two processes cannot
+            # both claim the same reference
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT state, updated_at FROM submissions WHERE reference = ?",
+                    (reference,)
+                ).fetchone()
+                if row is not None and row[0] == SENT:
+                    outcome = ALREADY_SENT
+                elif row is not None and row[0] == PENDING and now - row[1] < IN_FLIGHT_TIMEOUT:
+                    outcome = IN_FLIGHT
+                else:
+                    self._conn.execute(
+                        "INSERT INTO submissions (reference, payload_hash, state, attempts, updated_at)"
+                        " VALUES (?, ?, ?, 1, ?)"
+                        " ON CONFLICT(reference) DO UPDATE SET payload_hash = excluded.payload_hash,"
+                        " state = excluded.state, attempts = attempts + 1,"
+                        " updated_at = excluded.updated_at",
+                        (reference, digest, PENDING, now)
+                    )
+                    outcome = CLAIMED
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return outcome
+
+    def touch(self, references: List[str]):
+        """Refresh the claim time of references that are still pending."""
+        references = list(references)
+        if not references:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE submissions SET updated_at = ? WHERE state = ?"
+                f" AND reference IN ({', '.join('?' * len(references))})",
+                (time.time(), PENDING, *references)
+            )
+
+    @contextmanager
+    def keep_claimed(self, references: List[str]) -> Iterator[None]:
+        """
+        Heartbeat claims for as long as the block runs.
+
+        Without this a claim would look abandoned after IN_FLIGHT_TIMEOUT,
+        and a push slowed by rate limiting and retries could be claimed and
+        POSTed again by another session.
+
+        Args:
+            references: Claimed references; may be appended to inside the
+                block, and entries already marked sent or failed are ignored
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(CLAIM_HEARTBEAT_INTERVAL):
+                try:
+                    self.touch(list(references))
+                except sqlite3.Error:
+                    # Missed beats are tolerated up to IN_FLIGHT_TIMEOUT
+                    pass
+
+        threading.Thread(target=beat, name="po-claim-heartbeat", daemon=True).start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def _set_state(self, reference: str, state: str, cin7_id=None, detail: str = ""):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE submissions SET state = ?, cin7_id = COALESCE(?, cin7_id),"
+                " detail = ?, updated_at = ? WHERE reference = ?",
+                (state, cin7_id, detail, time.time(), reference)
+            )
+
+    def mark_sent(self, reference: str, cin7_id=None, detail: str = ""):
+        """Record that Cin7 has the PO."""
+        self._set_state(reference, SENT, cin7_id, detail)
+
+    def mark_failed(self, reference: str, detail: str = ""):
+        """Record a failed submission so the next run may retry it."""
+        self._set_state(reference, FAILED, None, detail)
+
+    def forget(self, reference: str) -> bool:
+        """
+        Drop a PO reference from the journal so it can be raised again.
+
+        Use after the PO has been deleted in Cin7; the existence check in
+        push_pos_once still skips it while Cin7 has a PO with that reference.
+
+        Returns:
+            True if an entry was removed
+        """
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM submissions WHERE reference = ?", (reference,))
+        return cur.rowcount > 0
+
+
+def get_po_journal(path: str = DEFAULT_JOURNAL_PATH) -> PoJournal:
+    """
+    Get the process-wide journal for a path, creating it on first use.
+
+    Args:
+        path: Location of the SQLite file
+
+    Returns:
+        Shared PoJournal instance
+    """
+    with _journals_lock:
+        journal = _journals.get(path)
+        if journal is None:
+            journal = _journals[path] = PoJournal(path)
+        return journal
@@ -0,0 +1,301 @@
+"""
+PO Push Module
+Pushes supplier purchase orders to Cin7 concurrently and reports each
+result as soon as it finishes. POs can go one per request, or batched
+into Cin7's array payload with per-item results mapped back to each PO.
+push_pos_once wraps either mode with the submission journal so each PO
+reference is created at most once.
+"""
+
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import pandas as pd
+
+from cin7_client import Cin7Error, chunk_values, paginate, where_any
+from po_journal import ALREADY_SENT, CLAIMED, PoJournal, payload_hash
+
+# Max POs in flight; the Cin7 client's rate limiter still paces the calls
+DEFAULT_MAX_WORKERS = 4
+
+# Max POs per v1/PurchaseOrders POST (Cin7 accepts up to 50 records per request)
+DEFAULT_BATCH_SIZE = 50
+
+
+def po_references(qref: str, suppliers: Iterable[Tuple[str, Any]]) -> Dict[str, str]:
+    """
+    PO reference per supplier: PO-<qref><first 4 letters of the supplier>.
+
+    Suppliers whose names start with the same four letters (e.g. "ACME Ltd"
+    and "ACME Tools") would share a reference, so those get their Contact
+    ID appended. Suppliers with a unique prefix keep the plain reference.
+
+    Args:
+        qref: Q-ref or batch reference
+        suppliers: (supplier name, Contact ID) pairs
+
+    Returns:
+        Dictionary of supplier name to PO reference
+    """
+    suppliers = list(suppliers)
+    prefix = {name: f"PO-{qref}{str(name)[:4].upper()}" for name, _ in suppliers}
+    shared = Counter(prefix.values())
+    return {
+        name: prefix[name] + (f"-{contact_id}" if shared[prefix[name]] > 1 else "")
+        for name, contact_id in suppliers
+    }
+
+
+def _result(supplier: str, reference: str, ok: bool, status_code, seconds: float,
+            response, cin7_id=None, skipped: bool = False) -> Dict[str, Any]:
+    return {
+        "supplier": supplier,
+        "reference": reference,
+        "ok": ok,
+        "status_code": status_code,
+        "seconds": round(seconds, 2),
+        "response": response,
+        "cin7_id": cin7_id,
+        "skipped": skipped,
+    }
+
+
+def _push_batch(push_batch: Callable,
+                batch: List[Tuple[str, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    POST a batch of POs in one request and split the reply per PO.
+
+    Cin7 answers an array POST with one item per record, e.g.
+    {"index": 0, "success": true, "id": 123, "errors": []}, so records can
+    fail individually while the rest of the batch is created.
+    """
+    started = time.monotonic()
+    try:
+        status, response = push_batch([payload for _, _, payload in batch])
+    except Cin7Error as e:
+        status, response = e.status, str(e)
+    seconds = time.monotonic() - started
+
+    if status != 200:
+        return [_result(sup, ref, False, status, seconds, response) for sup, ref, _ in batch]
+
+    try:
+        items = json.loads(response)
+    except (TypeError, ValueError):
+        items = None
+    if not isinstance(items, list):
+        return [_result(sup, ref, False, status, seconds, f"Unexpected response: {response}")
+                for sup, ref, _ in batch]
+
+    by_index = {}
+    for pos, item in enumerate(items):
+        if isinstance(item, dict):
+            by_index[item.get("index", pos)] = item
+
+    results = []
+    for pos, (sup, ref, _) in enumerate(batch):
+        item = by_index.get(pos)
+        if item is None:
+            results.append(_result(sup, ref, False, status, seconds, "No result returned for this PO"))
+        elif item.get("success"):
+            results.append(_result(sup, ref, True, status, seconds, item, cin7_id=item.get("id")))
+        else:
+            errors = item.get("errors") or ["Rejected by Cin7"]
+            results.append(_result(sup, ref, False, status, seconds, "; ".join(map(str, errors))))
+    return results
+
+
+def push_pos_concurrently(payloads: List[Tuple[str, str, Dict[str, Any]]],
+                          push_po: Callable,
+                          max_workers: int = DEFAULT_MAX_WORKERS) -> Iterator[Dict[str, Any]]:
+    """
+    Push supplier POs in parallel, yielding results in completion order.
+
+    Args:
+        payloads: (supplier, reference, payload) tuples from build_po_payloads
+        push_po: The app's push function, returning (status code, response text)
+        max_workers: Max POs in flight
+
+    Yields:
+        Result dict per PO: supplier, reference, ok, status_code, seconds,
+        response, cin7_id, skipped
+    """
+    if not payloads:
+        return
+
+    workers = max(1, min(max_workers, len(payloads)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            # A single PO is a batch of one, so Cin7's per-item success
+            # flag is checked the same way in both modes
+            pool.submit(_push_batch, lambda batch: push_po(batch[0]), [item])
+            for item in payloads
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def push_pos_batched(payloads: List[Tuple[str, str, Dict[str, Any]]],
+                     push_batch: Callable,
+                     batch_size: int = DEFAULT_BATCH_SIZE,
+                     max_workers: int = DEFAULT_MAX_WORKERS) -> Iterator[Dict[str, Any]]:
+    """
+    Push supplier POs in as few requests as Cin7 allows.
+
+    Args:
+        payloads: (supplier, reference, payload) tuples from build_po_payloads
+        push_batch: The app's batch push, taking a list of payloads and
+            returning (status code, response text)
+        batch_size: Max POs per request
+        max_workers: Max requests in flight
+
+    Yields:
+        Result dict per PO (as push_pos_concurrently), batch by batch
+    """
+    if not payloads:
+        return
+
+    size = max(1, batch_size)
+    batches = [payloads[i:i + size] for i in range(0, len(payloads), size)]
+    workers = max(1, min(max_workers, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_push_batch, push_batch, batch) for batch in batches]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def find_existing_pos(cin7_get: Callable, references: List[str]) -> Dict[str, Any]:
+    """
+    Look up which PO references already exist in Cin7.
+
+    Returns:
+        Dictionary of reference (as given) to Cin7 PO id
+
+    Raises:
+        Cin7Error: The lookup failed, so existence is unknown
+    """
+    by_upper = {ref.upper(): ref for ref in references}
+    found = {}
+    for chunk in chunk_values("reference", references):
+        rows = paginate(cin7_get, "v1/PurchaseOrders", params={"where": where_any("reference", chunk)},
+                        fields=("id", "reference"))
+        for row in rows:
+            ref = by_upper.get(str(row.get("reference") or "").upper())
+            if ref:
+                found[ref] = row.get("id")
+    return found
+
+
+def push_pos_once(payloads: List[Tuple[str, str, Dict[str, Any]]],
+                  journal: PoJournal,
+                  cin7_get: Callable,
+                  push: Callable) -> Iterator[Dict[str, Any]]:
+    """
+    Push POs at most once each, resuming only the unsent ones after a rerun.
+
+    Each reference is claimed in the journal before anything is sent. Claimed
+    references are then checked against Cin7 (batched by reference), and
+    only those Cin7 does not already have are passed to `push`. Outcomes are
+    written back to the journal as they arrive.
+
+    Args:
+        payloads: (supplier, reference, payload) tuples from build_po_payloads
+        journal: Submission journal
+        cin7_get: The app's Cin7 GET helper
+        push: Callable taking a list of payload tuples and yielding results,
+            e.g. a partial of push_pos_batched or push_pos_concurrently
+
+    Yields:
+        Result dict per PO; POs that were not sent have skipped=True
+
+    Raises:
+        ValueError: Two payloads share a reference; nothing is claimed or sent
+    """
+    duplicates = sorted(ref for ref, n in Counter(ref for _, ref, _ in payloads).items() if n > 1)
+    if duplicates:
+        # The journal and the Cin7 check are keyed by reference, so the
+        # second PO would be skipped as already sent
+        raise ValueError(f"Duplicate PO reference(s) in one run: {', '.join(duplicates)}")
+
+    held: List[str] = []
+    # Claims are heartbeated until every outcome is recorded, so a slow,
+    # throttled push is never taken over by another session
+    with journal.keep_claimed(held):
+        yield from _push_claimed(payloads, journal, cin7_get, push, held)
+
+
+def _push_claimed(payloads: List[Tuple[str, str, Dict[str, Any]]], journal: PoJournal,
+                  cin7_get: Callable, push: Callable, held: List[str]) -> Iterator[Dict[str, Any]]:
+    """push_pos_once's body; claimed references are appended to `held`."""
+    claimed = []
+    for sup, ref, payload in payloads:
+        digest = payload_hash(payload)
+        outcome = journal.claim(ref, digest)
+        if outcome == CLAIMED:
+            claimed.append((sup, ref, payload))
+            held.append(ref)
+        elif outcome == ALREADY_SENT:
+            entry = journal.get(ref) or {}
+            note = "Already created — not sent again"
+            if entry.get("payload_hash") != digest:
+                note += " (selection has changed since; edit the PO in Cin7)"
+            yield _result(sup, ref, True, None, 0, note, cin7_id=entry.get("cin7_id"), skipped=True)
+        else:
+            yield _result(sup, ref, False, None, 0, "Being submitted by another session", skipped=True)
+
+    if not claimed:
+        return
+
+    try:
+        existing = find_existing_pos(cin7_get, [ref for _, ref, _ in claimed])
+    except Cin7Error as e:
+        # Never POST blind: without the check a retry could duplicate the PO
+        for sup, ref, _ in claimed:
+            journal.mark_failed(ref, f"Existence check failed: {e}")
+            yield _result(sup, ref, False, e.status, 0, f"Not sent — could not check Cin7 for an existing PO: {e}")
+        return
+
+    to_send = []
+    for item in claimed:
+        sup, ref, _ = item
+        if ref in existing:
+            journal.mark_sent(ref, existing[ref], "Found in Cin7")
+            yield _result(sup, ref, True, None, 0, "Already in Cin7 — not sent again",
+                          cin7_id=existing[ref], skipped=True)
+        else:
+            to_send.append(item)
+
+    if not to_send:
+        return
+
+    for result in push(to_send):
+        if result["ok"]:
+            journal.mark_sent(result["reference"], result.get("cin7_id"))
+        else:
+            journal.mark_failed(result["reference"], str(result["response"])[:500])
+        yield result
+
+
+def _status_label(r: Dict[str, Any]) -> str:
+    if r.get("skipped"):
+        return "⏭️ Skipped" if r["ok"] else "⏳ Not sent"
+    return "✔️ Created" if r["ok"] else "❌ Failed"
+
+
+def results_summary(results: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Summary table of push results for display."""
+    return pd.DataFrame([
+        {
+            "Supplier": r["supplier"],
+            "PO Ref": r["reference"],
+            "Status": _status_label(r),
+            "HTTP": r["status_code"],
+            "Cin7 ID": r.get("cin7_id") or "",
+            "Seconds": r["seconds"],
+            "Detail": "" if r["ok"] and not r.get("skipped") else str(r["response"])[:200],
+        }
+        for r in results
+    ])
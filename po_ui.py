@@ -0,0 +1,293 @@
+"""
+PO Wizard UI
+Streamlit panels shared by the app variants (app.py, apptest.py and
+podata.py): queueing PO jobs, the polled PO Jobs panel, batch mode, and the
+sidebar panels for the BOM cache, PO journal, sales-order mirror, product
+store and Cin7 stats. Each app passes in its own job runner, run_po_job,
+Cin7 getters and supplier resolution, so only catalogue loading and payload
+building differ per app.
+"""
+
+import json
+import time
+import uuid
+from typing import Callable, Optional
+
+import pandas as pd
+import streamlit as st
+
+from batch_orders import (DEFAULT_MAX_WORKERS, batch_reference, consolidate_lines, find_orders,
+                          orders_to_lines, parse_qrefs)
+from cin7_client import Cin7Error
+from po_jobs import ACTIVE_STATES, FAILED, INTERRUPTED
+from po_push import results_summary
+from sales_orders import SO_FIELDS, order_line_items
+
+JOB_ICONS = {"queued": "🕒", "running": "⏳", "done": "✅", "failed": "❌", "interrupted": "⚠️"}
+
+
+# ---------------------------------------------------------
+# PO JOBS — SUBMISSION + BACKGROUND PROGRESS (POLLED)
+# ---------------------------------------------------------
+def job_submitter() -> str:
+    """Logged-in user's email when auth is configured, else an id for this browser session."""
+    user = getattr(st, "user", None)
+    email = user.get("email") if user is not None else None
+    if email:
+        return email
+    # Kept in the URL so a page reload still shows this session's jobs
+    if "sid" not in st.query_params:
+        st.query_params["sid"] = uuid.uuid4().hex[:12]
+    return st.query_params["sid"]
+
+
+def queue_po_job(runner, qref: str, run_po_job: Callable, lines: pd.DataFrame,
+                 batch_mode: bool = True) -> str:
+    """
+    Hand the BOM expansion and push for some order lines to a background worker.
+
+    The page stays responsive and a rerun cannot kill the job halfway.
+
+    Args:
+        runner: The app's JobRunner (see po_jobs.get_job_runner)
+        qref: Q-ref or batch reference the PO references are built from
+        run_po_job: The app's job function, called as run_po_job(progress, qref, lines, batch_mode)
+        lines: Selected order lines, stored with the job as JSON records
+        batch_mode: Push POs in batched PurchaseOrders requests
+
+    Returns:
+        Job id
+    """
+    records = json.loads(lines.to_json(orient="records"))
+    return runner.submit(qref, run_po_job, submitted_by=job_submitter(),
+                         lines=records, batch_mode=batch_mode)
+
+
+@st.fragment(run_every="2s")
+def show_po_jobs(runner, run_po_job: Callable):
+    """
+    List this session's recent PO jobs with live progress, refreshed every 2 seconds.
+
+    Args:
+        runner: The app's JobRunner
+        run_po_job: The app's job function, used by Re-run
+    """
+    jobs = runner.recent(10, submitted_by=job_submitter())
+    if not jobs:
+        return
+
+    st.header("PO Jobs")
+    for job in jobs:
+        results = job["results"]
+        total = job["total"]
+        label = f"{JOB_ICONS.get(job['state'], '')} {job['qref']} — {job['state']}"
+        if total:
+            label += f" ({len(results)}/{total} POs)"
+
+        with st.expander(label, expanded=job["state"] in ACTIVE_STATES):
+            st.caption(f"Job {job['id']} · {job['stage'] or ''}")
+            if total:
+                st.progress(min(1.0, len(results) / total))
+            if job["error"]:
+                st.error(job["error"])
+            if results:
+                st.dataframe(results_summary(results), use_container_width=True)
+            if job["state"] in (FAILED, INTERRUPTED) and st.button("Re-run", key=f"rerun_{job['id']}"):
+                # Safe to repeat: the submission journal skips POs already created
+                runner.submit(job["qref"], run_po_job, submitted_by=job["submitted_by"], **job["params"])
+
+
+# ---------------------------------------------------------
+# BATCH MODE — MANY Q-REFS IN ONE RUN
+# ---------------------------------------------------------
+def drop_unresolved(lines: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop batch lines without a Cin7 contact, warning how many were skipped.
+
+    Args:
+        lines: Order lines with Supplier and Contact ID columns (a missing
+            Contact ID is NaN or blank)
+
+    Returns:
+        The lines that can be ordered, with an integer Contact ID
+    """
+    contact_ids = pd.to_numeric(lines["Contact ID"], errors="coerce")
+    suppliers = lines["Supplier"].fillna("").astype(str).str.strip()
+    unresolved = contact_ids.isna()
+    no_supplier = unresolved & (suppliers == "")
+    unmapped = unresolved & ~no_supplier
+
+    if no_supplier.any():
+        st.warning(
+            f"⚠️ {int(no_supplier.sum())} line(s) skipped — SKU has no supplier in the catalogue. "
+            "Order them through Steps 1–3 instead."
+        )
+    if unmapped.any():
+        st.warning(
+            f"⚠️ {int(unmapped.sum())} line(s) from {suppliers[unmapped].nunique()} supplier(s) skipped — "
+            f"supplier not mapped to a Cin7 contact: {', '.join(sorted(suppliers[unmapped].unique()))}. "
+            "Order them through Steps 1–3 instead."
+        )
+
+    kept = lines[~unresolved].copy()
+    kept["Contact ID"] = contact_ids[~unresolved].astype(int)
+    return kept
+
+
+def batch_mode_panel(runner, run_po_job: Callable, find_order: Callable, cin7_iter: Callable,
+                     resolve_lines: Callable[[pd.DataFrame], pd.DataFrame],
+                     max_workers: int = DEFAULT_MAX_WORKERS):
+    """
+    Draw the batch-mode expander: paste or upload Q-refs, find and
+    consolidate their orders, and queue one PO job for the whole batch.
+
+    Args:
+        runner: The app's JobRunner
+        run_po_job: The app's job function
+        find_order: The app's smart_find_order
+        cin7_iter: The app's streamed Cin7 GET (for order lines)
+        resolve_lines: Adds Supplier, Contact ID and (optionally) Supplier
+            Code to the order lines; lines it cannot resolve are dropped
+            and counted (see drop_unresolved)
+        max_workers: Max sales-order searches in flight
+    """
+    if "batch_lines" not in st.session_state:
+        st.session_state.batch_lines = None
+        st.session_state.batch_qrefs = []
+
+    with st.expander("📚 Batch mode — build POs for many Q-refs at once"):
+        st.caption(
+            "Sales orders are found concurrently, lines are consolidated per supplier item, "
+            "and each supplier gets one PO for the whole batch."
+        )
+        qref_text = st.text_area("Q-refs (one per line, or comma-separated)")
+        qref_file = st.file_uploader("…or upload a CSV of Q-refs", type="csv")
+
+        if st.button("Load Orders"):
+            batch_qrefs = parse_qrefs(qref_text, qref_file)
+            if not batch_qrefs:
+                st.error("❌ No Q-refs entered.")
+            else:
+                with st.spinner(f"Finding {len(batch_qrefs)} sales orders..."):
+                    orders, missing_orders, order_errors = find_orders(
+                        batch_qrefs, find_order, max_workers=max_workers
+                    )
+                if missing_orders:
+                    st.warning(f"⚠️ No sales order found for: {', '.join(missing_orders)}")
+                for q, err in order_errors.items():
+                    st.error(f"❌ {q}: Cin7 request failed — {err}")
+
+                try:
+                    batch_lines = orders_to_lines(orders, lambda so: order_line_items(so, cin7_iter))
+                except Cin7Error as e:
+                    st.error(f"❌ Could not load the order lines — {e}")
+                    batch_lines = orders_to_lines({})
+
+                # One supplier resolution across every order in the batch
+                batch_lines = drop_unresolved(resolve_lines(batch_lines))
+                batch_lines = consolidate_lines(batch_lines, extra=["Supplier Code"])
+                batch_lines.insert(0, "Select", True)
+                st.session_state.batch_qrefs = list(orders)
+                st.session_state.batch_lines = batch_lines
+                st.success(
+                    f"Loaded {len(orders)} order(s) → {len(batch_lines)} line(s) "
+                    f"for {batch_lines['Supplier'].nunique()} supplier(s)"
+                )
+
+        if st.session_state.batch_lines is not None:
+            edited_batch = st.data_editor(
+                st.session_state.batch_lines,
+                use_container_width=True,
+                key="batch_editor",
+                column_config={
+                    "Select": st.column_config.CheckboxColumn()
+                }
+            )
+            st.session_state.batch_lines = edited_batch
+
+            batch_ref = st.text_input(
+                "Batch reference (used in PO refs as PO-<ref><SUPP>)",
+                value=batch_reference(st.session_state.batch_qrefs)
+            )
+
+            if st.button("Queue Batch POs"):
+                selected_batch = edited_batch[edited_batch["Select"] == True]
+                if selected_batch.empty:
+                    st.error("❌ No items selected.")
+                else:
+                    job_id = queue_po_job(runner, batch_ref, run_po_job, selected_batch)
+                    st.success(f"🧾 Queued batch PO job `{job_id}` for {len(st.session_state.batch_qrefs)} order(s).")
+
+
+# ---------------------------------------------------------
+# SIDEBAR — BOM CACHE, PO JOURNAL, MIRRORS + CIN7 STATS
+# ---------------------------------------------------------
+def sidebar_panels(cin7_client, cin7_get: Callable, bom_cache, journal,
+                   so_mirror=None, so_mirror_interval: int = 300,
+                   product_store=None, product_sync_interval: int = 3600):
+    """
+    Draw the sidebar maintenance panels.
+
+    The mirror and product store panels are skipped when the app has them
+    turned off; when shown without a click, each starts its background sync.
+
+    Args:
+        cin7_client: The shared Cin7Client (for request stats)
+        cin7_get: The app's parsed Cin7 GET
+        bom_cache: Shared BomCache
+        journal: PO submission journal
+        so_mirror: SalesOrderMirror, or None when disabled
+        so_mirror_interval: Seconds between background mirror syncs
+        product_store: ProductStore, or None when the catalogue comes from elsewhere
+        product_sync_interval: Seconds between background product syncs
+    """
+    if st.sidebar.button("🔄 Refresh BOMs"):
+        cleared = bom_cache.invalidate()
+        st.sidebar.success(f"Cleared {cleared} cached BOMs — they will be refetched from Cin7")
+    st.sidebar.caption(f"🧩 {bom_cache.count()} BOM lookups cached")
+
+    with st.sidebar.expander("🧾 PO Journal"):
+        forget_ref = st.text_input(
+            "PO reference", key="forget_po_ref",
+            help="Once a PO has been deleted in Cin7, forget it here so it can be raised again"
+        ).strip()
+        if st.button("Forget PO", disabled=not forget_ref):
+            if journal.forget(forget_ref):
+                st.success(f"Forgot {forget_ref} — the next push will create it again")
+            else:
+                st.info(f"{forget_ref} is not in the journal")
+
+    if so_mirror is not None:
+        if st.sidebar.button("🔄 Sync Sales Orders"):
+            try:
+                with st.spinner("Syncing sales orders from Cin7..."):
+                    synced = so_mirror.sync(cin7_get, SO_FIELDS)
+                st.sidebar.success(f"Synced {synced} changed sales orders")
+            except Cin7Error as e:
+                st.sidebar.error(f"❌ Sales order sync failed: {e}")
+        else:
+            so_mirror.sync_in_background(cin7_get, SO_FIELDS, interval=so_mirror_interval)
+        synced_at: Optional[float] = so_mirror.last_synced()
+        st.sidebar.caption(
+            f"🗂️ {so_mirror.count()} sales orders mirrored"
+            + (f", synced {int(time.time() - synced_at)}s ago" if synced_at else ", first sync running")
+        )
+
+    if product_store is not None:
+        if st.sidebar.button("🔄 Sync Products"):
+            try:
+                with st.spinner("Syncing product catalogue from Cin7..."):
+                    counts = product_store.sync(cin7_get)
+                st.sidebar.success(f"Synced {counts['products']} changed products")
+                st.rerun()
+            except Cin7Error as e:
+                st.sidebar.error(f"❌ Product sync failed: {e}")
+        else:
+            product_store.sync_in_background(cin7_get, interval=product_sync_interval)
+        st.sidebar.caption(f"📦 {product_store.count()} products synced from Cin7")
+
+    cin7_stats = cin7_client.stats_snapshot()
+    st.sidebar.caption(
+        f"🔌 Cin7: {cin7_stats['requests']} calls, {cin7_stats['retries']} retries, "
+        f"{cin7_stats['throttled']} throttled"
+    )
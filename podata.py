@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
-import requests
-import json
-from requests.auth import HTTPBasicAuth
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Set, Tuple
 from db_config import get_product_database
+from bom_cache import get_bom_cache
+from cin7_client import get_cin7_client, Cin7Error
+from sales_orders import get_order_finder, order_line_items
+from so_mirror import get_so_mirror
+from po_jobs import get_job_runner
+from po_journal import get_po_journal
+from po_push import po_references, push_pos_batched, push_pos_concurrently, push_pos_once
+from po_ui import batch_mode_panel, queue_po_job, show_po_jobs, sidebar_panels
 
 # ---------------------------------------------------------
 # PAGE CONFIG
@@ -19,11 +24,51 @@ cin7 = st.secrets["cin7"]
 base_url = cin7["base_url"].rstrip("/")
 api_username = cin7["api_username"]
 api_key = cin7["api_key"]
-auth = HTTPBasicAuth(api_username, api_key)
+
+# One pooled keep-alive session per process, shared by every session.
+# Rate limits default to Cin7's published 3/sec and 60/min per account.
+cin7_client = get_cin7_client(
+    base_url, api_username, api_key,
+    pool_size=int(cin7.get("pool_size", 10)),
+    rate_per_second=int(cin7.get("rate_per_second", 3)),
+    rate_per_minute=int(cin7.get("rate_per_minute", 60)),
+)
 
 branch_Hamilton = cin7.get("branch_Hamilton", cin7.get("branch_hamilton_id", 230))
 branch_Avondale = cin7.get("branch_Avondale", cin7.get("branch_avondale_id", 3))
 
+# Max concurrent BOM lookups in flight (keep under Cin7's rate limit)
+bom_max_workers = int(cin7.get("bom_max_workers", 4))
+
+# Max supplier POs pushed in parallel
+po_max_workers = int(cin7.get("po_max_workers", 4))
+
+# Max POs per PurchaseOrders POST in batch mode
+po_batch_size = int(cin7.get("po_batch_size", 50))
+
+# Max sales-order searches in flight in batch mode
+so_max_workers = int(cin7.get("so_max_workers", 4))
+
+# Found sales orders are reused for this many seconds
+order_finder = get_order_finder(ttl=int(cin7.get("so_cache_ttl", 120)))
+
+# Optional local mirror of recent open sales orders (synced on modifiedDate)
+so_mirror_interval = int(cin7.get("so_mirror_sync_interval", 300))
+so_mirror = get_so_mirror(
+    initial_days=int(cin7.get("so_mirror_days", 90)),
+    max_stale=int(cin7.get("so_mirror_max_stale", 2 * so_mirror_interval)),
+) if cin7.get("so_mirror", False) else None
+
+# Persistent BOM cache shared by all sessions and app variants
+bom_cache = get_bom_cache(max_age=int(cin7.get("bom_cache_max_age", 3600)))
+
+# Submission journal: each PO reference is created in Cin7 at most once
+po_journal = get_po_journal()
+
+# Background PO builds: Create POs queues a job instead of blocking the page
+# Jobs are tagged with this app variant, which builds its own payloads
+po_jobs = get_job_runner(max_workers=int(cin7.get("po_job_workers", 2)), app="podata")
+
 # ---------------------------------------------------------
 # GOOGLE SHEETS DATABASE CONFIG
 # ---------------------------------------------------------
@@ -33,110 +78,119 @@ branch_Avondale = cin7.get("branch_Avondale", cin7.get("branch_avondale_id", 3))
 # ---------------------------------------------------------
 # HTTP HELPERS
 # ---------------------------------------------------------
-def cin7_get(endpoint: str, params: Optional[Dict[str, Any]] = None):
-    url = f"{base_url}/{endpoint}"
-    r = requests.get(url, params=params, auth=auth, timeout=30)
-    return r.json() if r.status_code == 200 else None
+def cin7_get(endpoint: str, params: Optional[Dict[str, Any]] = None,
+             fields: Optional[Tuple[str, ...]] = None):
+    return cin7_client.get(endpoint, params=params, fields=fields)
+
+def cin7_iter(endpoint: str, prefix: str = "item", params: Optional[Dict[str, Any]] = None,
+              fields: Optional[Tuple[str, ...]] = None):
+    return cin7_client.iter_items(endpoint, prefix=prefix, params=params, fields=fields)
 
 # ---------------------------------------------------------
 # DATABASE LOOKUPS (CACHED)
 # ---------------------------------------------------------
-@st.cache_data(ttl=3600)
-def db_product_by_sku(sku: str) -> Optional[Dict[str, Any]]:
-    """Query products from Google Sheets database."""
-    sku = (sku or "").strip()
-    if not sku:
-        return None
+def db_products_by_skus(skus: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Set[str]]:
+    """
+    Resolve many SKUs against the Google Sheets database in one pass.
+
+    Returns:
+        (found, missing): found maps SKU to its product record, missing
+        holds the SKUs with no product
+    """
+    wanted = {(s or "").strip() for s in skus} - {""}
+    if not wanted:
+        return {}, set()
 
     db = get_product_database()
     if not db:
-        return None
+        return {}, wanted
 
     try:
-        # Search for SKU in the database
-        results = db.search("sku", sku)
+        found = db.lookup_many("sku", wanted)
+    except Exception as e:
+        st.warning(f"⚠️ Database query error for SKUs: {e}")
+        return {}, wanted
 
-        if len(results) == 0:
-            return None
+    return found, wanted - found.keys()
 
-        # Return first match as dictionary
-        return results.iloc[0].to_dict()
-    except Exception as e:
-        st.warning(f"⚠️ Database query error for SKU {sku}: {e}")
-        return None
+def db_product_by_sku(sku: str) -> Optional[Dict[str, Any]]:
+    """Query products from Google Sheets database."""
+    found, _ = db_products_by_skus([sku])
+    return found.get((sku or "").strip())
 
-@st.cache_data(ttl=3600)
-def db_supplier_map_get(supplier_name: str) -> Optional[int]:
-    """Look up supplier ID from Google Sheets database."""
-    supplier_name = (supplier_name or "").strip()
-    if not supplier_name:
-        return None
+def db_supplier_ids(supplier_names) -> Dict[str, int]:
+    """
+    Look up Cin7 contact IDs for many supplier names at once.
+
+    Returns:
+        Dictionary of supplier name to contact ID; unmapped names are left out
+    """
+    wanted = {(n or "").strip() for n in supplier_names} - {""}
+    if not wanted:
+        return {}
 
     db = get_product_database()
     if not db:
-        return None
+        return {}
 
     try:
-        # Search for supplier by name
-        results = db.search("suppliername", supplier_name)
-
-        if len(results) == 0:
-            return None
+        found = db.lookup_many("suppliername", wanted)
+    except Exception as e:
+        st.warning(f"⚠️ Database query error for suppliers: {e}")
+        return {}
 
-        # Return supplier ID
-        row = results.iloc[0]
+    out = {}
+    for name, row in found.items():
         supplier_id = row.get("supplierid")
-        if supplier_id:
-            return int(supplier_id)
-        return None
-    except Exception as e:
-        st.warning(f"⚠️ Database query error for supplier {supplier_name}: {e}")
-        return None
+        if not supplier_id:
+            continue
+        try:
+            out[name] = int(supplier_id)
+        except (TypeError, ValueError):
+            # Bad sheet data: warn and leave the supplier unmapped
+            st.warning(f"⚠️ Invalid supplier ID for {name}: {supplier_id!r}")
+    return out
+
+def db_supplier_map_get(supplier_name: str) -> Optional[int]:
+    """Look up supplier ID from Google Sheets database."""
+    return db_supplier_ids([supplier_name]).get((supplier_name or "").strip())
+
+def resolve_batch_suppliers(lines: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add Supplier, Supplier Code and Contact ID to batch-mode order lines.
+
+    One SKU lookup and one supplier lookup cover every order in the batch;
+    unresolved lines get a blank Supplier or no Contact ID.
+    """
+    products, _ = db_products_by_skus(lines["Item Code"].tolist())
+    lines = lines.copy()
+    lines["Supplier"] = lines["Item Code"].map(lambda c: products.get(c, {}).get("supplier_name", ""))
+    lines["Supplier Code"] = lines["Item Code"].map(lambda c: products.get(c, {}).get("supplier_code", ""))
+    lines["Contact ID"] = lines["Supplier"].map(db_supplier_ids(lines["Supplier"].unique()))
+    return lines
 
 # ---------------------------------------------------------
-# BOM LOOKUP (CACHED)
+# BOM LOOKUP (PERSISTENT CACHE)
 # ---------------------------------------------------------
-@st.cache_data(ttl=3600)
 def get_bom(code: str):
-    search = cin7_get("v1/BomMasters", params={"where": f"code='{code}'"})
-    if not search:
-        return []
-    bom_id = search[0].get("id")
-    if not bom_id:
-        return []
-
-    bom_data = cin7_get(f"v2/BomMasters/{bom_id}")
-    if not bom_data:
-        return []
-
-    out = []
-    for c in bom_data.get("products", []):
-        out.append({
-            "code": c.get("code"),
-            "qty": c.get("quantity", 1),
-            "unitCost": c.get("unitCost", 0)
-        })
-    return out
+    return bom_cache.lookup(code, cin7_get)
+
+# ---------------------------------------------------------
+# BOM PREFETCH (BATCHED + CONCURRENT)
+# ---------------------------------------------------------
+def prefetch_boms(codes) -> Dict[str, list]:
+    """
+    Expand each distinct item code once. Codes are looked up in batched
+    BomMasters searches, with at most bom_max_workers requests in flight.
+    Returns {code: components} ([] when not a BOM).
+    """
+    return bom_cache.lookup_many(codes, cin7_get, max_workers=bom_max_workers)
 
 # ---------------------------------------------------------
 # SMART ORDER SEARCH
 # ---------------------------------------------------------
 def smart_find_order(qref: str):
-    q = (qref or "").strip().upper()
-    if not q:
-        return None
-
-    tests = [
-        f"reference='{q}'",
-        f"customerOrderNo='{q}'",
-        f"reference like '%{q}%'",
-        f"customerOrderNo like '%{q}%'"
-    ]
-    for t in tests:
-        res = cin7_get("v1/SalesOrders", params={"where": t})
-        if res:
-            return res[0]
-    return None
+    return order_finder.find(qref, cin7_iter, mirror=so_mirror)
 
 # ---------------------------------------------------------
 # PO BUILD
@@ -144,9 +198,16 @@ def smart_find_order(qref: str):
 def build_po_payloads(qref: str, df: pd.DataFrame):
     po_groups = []
 
+    # Resolve every BOM up front so lookups overlap instead of running per line
+    boms = prefetch_boms((c or "").strip() for c in df["Item Code"])
+
+    # Suppliers sharing a 4-letter prefix get distinct refs
+    contact_ids = df.groupby("Supplier")["Contact ID"].first()
+    po_refs = po_references(qref, ((name, int(cid)) for name, cid in contact_ids.items()))
+
     for supplier_name, grp in df.groupby("Supplier"):
         supplier_id = int(grp["Contact ID"].iloc[0])
-        po_ref = f"PO-{qref}{supplier_name[:4].upper()}"
+        po_ref = po_refs[supplier_name]
 
         line_items = []
         for _, r in grp.iterrows():
@@ -154,7 +215,7 @@ def build_po_payloads(qref: str, df: pd.DataFrame):
             qty = float(r["Qty"])
             cost = float(r["Cost"])
 
-            bom = get_bom(code)
+            bom = boms.get(code, [])
             if bom:
                 for c in bom:
                     line_items.append({
@@ -189,10 +250,41 @@ def build_po_payloads(qref: str, df: pd.DataFrame):
     return po_groups
 
 def push_po(payload: Dict[str, Any]) -> Tuple[int, str]:
-    url = f"{base_url}/v1/PurchaseOrders"
-    headers = {"Content-Type": "application/json"}
-    r = requests.post(url, headers=headers, data=json.dumps([payload]), auth=auth, timeout=60)
-    return r.status_code, r.text
+    return cin7_client.post("v1/PurchaseOrders", [payload])
+
+def push_po_batch(payloads: List[Dict[str, Any]]) -> Tuple[int, str]:
+    return cin7_client.post("v1/PurchaseOrders", payloads)
+
+def push_supplier_pos(items, batch_mode: bool):
+    if batch_mode:
+        return push_pos_batched(items, push_po_batch,
+                                batch_size=po_batch_size, max_workers=po_max_workers)
+    return push_pos_concurrently(items, push_po, max_workers=po_max_workers)
+
+# ---------------------------------------------------------
+# PO JOB (RUNS ON A BACKGROUND WORKER)
+# ---------------------------------------------------------
+def run_po_job(progress, qref: str, lines: List[Dict[str, Any]], batch_mode: bool = True):
+    """Expand BOMs and push the POs for one Q-ref, reporting into the job store."""
+    progress.stage("Expanding BOMs")
+    payloads = build_po_payloads(qref, pd.DataFrame(lines))
+
+    progress.set_total(len(payloads))
+    progress.stage(f"Pushing {len(payloads)} PO(s)")
+
+    # Journal + Cin7 check first, so re-runs only send unsent POs
+    pushes = push_pos_once(payloads, po_journal, cin7_get,
+                           lambda items: push_supplier_pos(items, batch_mode))
+    for result in pushes:
+        progress.add_result(result)
+
+# ---------------------------------------------------------
+# SIDEBAR — BOM CACHE, SALES ORDER MIRROR + CIN7 STATS
+# ---------------------------------------------------------
+sidebar_panels(
+    cin7_client, cin7_get, bom_cache, po_journal,
+    so_mirror=so_mirror, so_mirror_interval=so_mirror_interval,
+)
 
 # ---------------------------------------------------------
 # SESSION STATE
@@ -207,7 +299,11 @@ st.header("Step 1 — Enter Q Ref")
 qref = st.text_input("Enter Q-number (e.g. Q19663E.S26):")
 
 if st.button("Load Order"):
-    so = smart_find_order(qref)
+    try:
+        so = smart_find_order(qref)
+    except Cin7Error as e:
+        st.error(f"❌ Cin7 request failed — {e}")
+        st.stop()
     if not so:
         st.error("❌ No matching Sales Order found.")
         st.stop()
@@ -217,21 +313,25 @@ if st.button("Load Order"):
     st.write("**Project:**", so.get("projectName", ""))
     st.write("**Order Ref:**", qref)
 
-    rows = []
-    missing_in_railway = []
-
-    for li in so.get("lineItems", []):
-        if li.get("productId", 0) == 0:
-            continue
+    try:
+        # Lines come with the found order (see sales_orders.order_line_items);
+        # only the product lines are kept
+        line_items = [
+            (li, (li.get("code", "") or "").upper().strip())
+            for li in order_line_items(so, cin7_iter)
+            if li.get("productId", 0) != 0
+        ]
+    except Cin7Error as e:
+        st.error(f"❌ Could not load the order lines — {e}")
+        st.stop()
+    line_items = [(li, code) for li, code in line_items if code]
 
-        code = (li.get("code", "") or "").upper().strip()
-        if not code:
-            continue
+    # Check every SKU exists in cin7_products table in one lookup
+    products, missing_in_railway = db_products_by_skus([code for _, code in line_items])
 
-        # Check SKU exists in cin7_products table
-        prod = db_product_by_sku(code)
-        if not prod:
-            missing_in_railway.append(code)
+    rows = []
+    for li, code in line_items:
+        prod = products.get(code)
 
         # Auto-populate supplier from database if available
         supplier_name = prod.get("supplier_name", "") if prod else ""
@@ -283,27 +383,25 @@ if st.session_state.lines is not None:
         if st.button("Resolve Contact IDs"):
             df = st.session_state.lines.copy()
 
-            missing_supplier = 0
-            unmapped = 0
-
-            for i, r in df.iterrows():
-                supplier_name = (r.get("Supplier") or "").strip()
-                if not supplier_name:
-                    df.at[i, "Contact ID"] = ""
-                    df.at[i, "Notes"] = "Missing Supplier"
-                    missing_supplier += 1
-                    continue
-
-                cid = db_supplier_map_get(supplier_name)
-                if cid is None:
-                    df.at[i, "Contact ID"] = ""
-                    df.at[i, "Notes"] = "Supplier not mapped in supplier_map table"
-                    unmapped += 1
-                else:
-                    df.at[i, "Contact ID"] = int(cid)
-                    # keep existing notes if it was about sku missing
-                    if df.at[i, "Notes"] in ("Missing Supplier", "Supplier not mapped in supplier_map table"):
-                        df.at[i, "Notes"] = ""
+            # One lookup per distinct supplier, then map every line at once
+            names = df["Supplier"].fillna("").astype(str).str.strip()
+            contact_ids = names.map(db_supplier_ids(names.unique()))
+
+            is_missing = names == ""
+            is_unmapped = ~is_missing & contact_ids.isna()
+
+            df["Contact ID"] = contact_ids.astype("Int64").astype(object).where(contact_ids.notna(), "")
+
+            # keep existing notes if it was about sku missing
+            supplier_notes = ("Missing Supplier", "Supplier not mapped in supplier_map table")
+            notes = df["Notes"].fillna("") if "Notes" in df.columns else pd.Series("", index=df.index)
+            notes = notes.mask(notes.isin(supplier_notes), "")
+            notes = notes.mask(is_missing, "Missing Supplier")
+            notes = notes.mask(is_unmapped, "Supplier not mapped in supplier_map table")
+            df["Notes"] = notes
+
+            missing_supplier = int(is_missing.sum())
+            unmapped = names[is_unmapped].nunique()
 
             st.session_state.lines = df
 
@@ -325,6 +423,11 @@ if st.session_state.lines is not None:
 if st.session_state.lines is not None:
     st.header("Step 3 — Create Purchase Orders")
 
+    batch_mode = st.checkbox(
+        "Batch push (send up to po_batch_size POs per request)", value=True,
+        help="Fewer Cin7 requests; each PO still gets its own result."
+    )
+
     if st.button("Create POs"):
         df_all = st.session_state.lines.copy()
         selected = df_all[df_all["Select"] == True]
@@ -353,17 +456,17 @@ if st.session_state.lines is not None:
         # Convert Contact ID to int now that it's validated
         selected["Contact ID"] = selected["Contact ID"].astype(int)
 
-        # Create POs per supplier group
-        for supplier, items in selected.groupby("Supplier"):
-            df_grp = pd.DataFrame(items)
-            po_ref = f"PO-{qref}{supplier[:4].upper()}"
+        # Runs on a background worker; progress is shown under PO Jobs
+        job_id = queue_po_job(po_jobs, qref, run_po_job, selected, batch_mode=batch_mode)
+        st.success(f"🧾 Queued PO job `{job_id}` for {qref}. Keep working — progress is shown under PO Jobs.")
 
-            st.write(f"📦 **Creating PO:** {po_ref}")
+# ---------------------------------------------------------
+# BATCH MODE — MANY Q-REFS IN ONE RUN
+# ---------------------------------------------------------
+batch_mode_panel(po_jobs, run_po_job, smart_find_order, cin7_iter,
+                 resolve_batch_suppliers, max_workers=so_max_workers)
 
-            payloads = build_po_payloads(qref, df_grp)
-            for sup, ref, payload in payloads:
-                status, resp = push_po(payload)
-                if status == 200:
-                    st.success(f"{ref} ✔️ Created")
-                else:
-                    st.error(f"{ref} ❌ Failed — {resp}")
+# ---------------------------------------------------------
+# PO JOBS — BACKGROUND PROGRESS (POLLED)
+# ---------------------------------------------------------
+show_po_jobs(po_jobs, run_po_job)
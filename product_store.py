@@ -0,0 +1,288 @@
+"""
+Product Store Module
+Local SQLite copy of the Cin7 product catalogue (one row per product option
+code) plus the supplier contacts it references. Filled by an incremental
+sync on modifiedDate using concurrent page fetches, and read back as the
+same Code/Supplier/Contact ID frame the apps load from Products.csv. A full
+sync rebuilds the store: rows it did not see (deleted in Cin7) are removed.
+
+Run a sync from the command line with:
+    CIN7_BASE_URL=... CIN7_API_USERNAME=... CIN7_API_KEY=... python product_store.py [--full]
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import pandas as pd
+
+from cin7_client import PAGE_SIZE, Cin7Error, paginate
+
+# Override with the PRODUCT_STORE_PATH environment variable (e.g. a mounted volume)
+DEFAULT_STORE_PATH = os.environ.get(
+    "PRODUCT_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "product_store.sqlite")
+)
+
+# Pages requested ahead concurrently; the Cin7 client's rate limiter still applies
+DEFAULT_PREFETCH = 3
+
+# Seconds between background syncs
+DEFAULT_SYNC_INTERVAL = 3600
+
+# Only the fields the catalogue frame is built from
+PRODUCT_FIELDS = ("id", "name", "styleCode", "supplierId", "modifiedDate", "productOptions")
+SUPPLIER_FIELDS = ("id", "company", "modifiedDate")
+
+# Same columns as Products.csv / the Google Sheet
+CATALOGUE_COLUMNS = ["Product Name", "Style Code", "Code", "Supplier Code", "Supplier", "Contact ID"]
+
+# Cin7's date format for where clauses; the first sync starts here
+EPOCH = "2000-01-01T00:00:00Z"
+
+_stores: Dict[str, "ProductStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class ProductStore:
+    """SQLite catalogue of Cin7 product options and supplier names."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        """
+        Open (or create) the store database.
+
+        Args:
+            path: Location of the SQLite file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " code TEXT PRIMARY KEY,"
+                " product_id INTEGER NOT NULL,"
+                " product_name TEXT,"
+                " style_code TEXT,"
+                " supplier_code TEXT,"
+                " contact_id INTEGER,"
+                " modified TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS products_product_id ON products (product_id)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS suppliers ("
+                " id INTEGER PRIMARY KEY,"
+                " name TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            # Full-sync pass that last wrote each row (mark-and-sweep); added
+            # to stores created before full syncs swept deleted rows
+            for table in ("products", "suppliers"):
+                existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                if "sync_pass" not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN sync_pass INTEGER")
+            self._conn.commit()
+
+    def _meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._conn.commit()
+
+    def put_products(self, products: Iterable[Dict[str, Any]], sync_pass: Optional[int] = None):
+        """Replace the option rows of each product (options removed in Cin7 are dropped)."""
+        products = list(products)
+        rows = []
+        for p in products:
+            for option in p.get("productOptions") or []:
+                code = str(option.get("code") or "").upper().strip()
+                if code:
+                    rows.append((
+                        code, p["id"], p.get("name") or "", p.get("styleCode") or "",
+                        option.get("supplierCode") or "", p.get("supplierId") or None,
+                        p.get("modifiedDate"), sync_pass,
+                    ))
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM products WHERE product_id = ?", [(p["id"],) for p in products]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO products (code, product_id, product_name, style_code,"
+                " supplier_code, contact_id, modified, sync_pass) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def put_suppliers(self, contacts: Iterable[Dict[str, Any]], sync_pass: Optional[int] = None):
+        """Insert or rename supplier contacts."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO suppliers (id, name, sync_pass) VALUES (?, ?, ?)",
+                [(c["id"], str(c.get("company") or "").strip(), sync_pass) for c in contacts]
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        """Number of product codes held locally."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def last_synced(self) -> Optional[float]:
+        """Unix time of the last successful sync, or None if never synced."""
+        value = self._meta("synced_at")
+        return float(value) if value else None
+
+    def read_frame(self) -> pd.DataFrame:
+        """
+        The catalogue as a DataFrame with the Products.csv columns.
+
+        Supplier names are joined at read time, so renaming a supplier in
+        Cin7 does not require re-syncing its products.
+        """
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT p.product_name AS [Product Name], p.style_code AS [Style Code],"
+                " p.code AS Code, p.supplier_code AS [Supplier Code],"
+                " COALESCE(s.name, '') AS Supplier, p.contact_id AS [Contact ID]"
+                " FROM products p LEFT JOIN suppliers s ON s.id = p.contact_id"
+                " ORDER BY p.code",
+                self._conn
+            )
+
+    def _sync_endpoint(self, cin7_get: Callable, endpoint: str, key: str, where: str,
+                       fields: Iterable[str], store: Callable, prefetch: int) -> int:
+        since = self._meta(key) or EPOCH
+        clause = f"modifiedDate >= '{since}'" + (f" AND {where}" if where else "")
+        records = paginate(cin7_get, endpoint, params={"where": clause, "order": "modifiedDate"},
+                           fields=fields, prefetch=prefetch)
+        fetched = 0
+        newest = since
+        # Stored a page at a time so an interrupted sync keeps its progress
+        while True:
+            rows = list(islice(records, PAGE_SIZE))
+            if not rows:
+                break
+            store(rows)
+            fetched += len(rows)
+            for row in rows:
+                newest = max(newest, row.get("modifiedDate") or newest)
+        self._set_meta(key, newest)
+        return fetched
+
+    def sync(self, cin7_get: Callable, full: bool = False,
+             prefetch: int = DEFAULT_PREFETCH) -> Dict[str, int]:
+        """
+        Pull suppliers and products modified since the last sync.
+
+        Args:
+            cin7_get: A Cin7 GET callable (the app's cin7_get or Cin7Client.get)
+            full: Ignore the watermarks, re-read the whole catalogue and then
+                delete every product and supplier this pass did not see
+            prefetch: Pages requested ahead concurrently
+
+        Returns:
+            {"suppliers": n, "products": n} records fetched
+
+        Raises:
+            Cin7Error: A page failed; pages already stored are kept and, on
+                a full sync, nothing is deleted
+        """
+        with self._sync_lock:
+            sync_pass = None
+            if full:
+                sync_pass = time.time_ns()
+                with self._lock:
+                    self._conn.execute("DELETE FROM meta WHERE key LIKE 'watermark_%'")
+                    self._conn.commit()
+            suppliers = self._sync_endpoint(
+                cin7_get, "v1/Contacts", "watermark_suppliers", "type='Supplier'",
+                SUPPLIER_FIELDS, lambda rows: self.put_suppliers(rows, sync_pass), prefetch
+            )
+            products = self._sync_endpoint(
+                cin7_get, "v1/Products", "watermark_products", "",
+                PRODUCT_FIELDS, lambda rows: self.put_products(rows, sync_pass), prefetch
+            )
+            if full:
+                # Only reached when every page came back, so a failed pass
+                # never empties the store
+                with self._lock:
+                    for table in ("products", "suppliers"):
+                        self._conn.execute(
+                            f"DELETE FROM {table} WHERE sync_pass IS NULL OR sync_pass != ?", (sync_pass,)
+                        )
+                    self._conn.commit()
+            self._set_meta("synced_at", str(time.time()))
+            return {"suppliers": suppliers, "products": products}
+
+    def sync_in_background(self, cin7_get: Callable, interval: int = DEFAULT_SYNC_INTERVAL) -> bool:
+        """
+        Start an incremental sync on a daemon thread if the last one is older than interval.
+
+        Returns:
+            True if a sync was started
+        """
+        synced = self.last_synced()
+        if synced is not None and time.time() - synced < interval:
+            return False
+        if self._sync_lock.locked():
+            return False
+
+        def run():
+            try:
+                self.sync(cin7_get)
+            except Cin7Error:
+                # The last synced catalogue keeps being served; the next interval retries
+                pass
+
+        threading.Thread(target=run, name="product-sync", daemon=True).start()
+        return True
+
+
+def get_product_store(path: str = DEFAULT_STORE_PATH) -> ProductStore:
+    """
+    Get the process-wide product store for a path, creating it on first use.
+
+    Args:
+        path: Location of the SQLite file
+
+    Returns:
+        Shared ProductStore instance
+    """
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ProductStore(path)
+        return store
+
+
+if __name__ == "__main__":
+    from cin7_client import get_cin7_client
+
+    parser = argparse.ArgumentParser(description="Sync the Cin7 product catalogue into the local store")
+    parser.add_argument("--full", action="store_true", help="re-read every product and drop those deleted in Cin7")
+    parser.add_argument("--path", default=DEFAULT_STORE_PATH, help="SQLite file to write")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH, help="pages fetched ahead")
+    args = parser.parse_args()
+
+    client = get_cin7_client(
+        os.environ["CIN7_BASE_URL"], os.environ["CIN7_API_USERNAME"], os.environ["CIN7_API_KEY"]
+    )
+    started = time.monotonic()
+    counts = get_product_store(args.path).sync(client.get, full=args.full, prefetch=args.prefetch)
+    print(f"Synced {counts['products']} products and {counts['suppliers']} suppliers "
+          f"in {time.monotonic() - started:.1f}s")
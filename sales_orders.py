@@ -0,0 +1,176 @@
+"""
+Sales Order Lookup Module
+Finds the Cin7 sales order for a Q-ref in as few requests as possible:
+one OR'd exact-match query on reference and customerOrderNo (paged until
+a reference match), then (only on a miss) both wildcard searches
+concurrently. Search responses are streamed one order at a time, so a
+page of orders (with their lines) is never decoded as one document.
+Matches are cached briefly per Q-ref so reloading or re-queuing an order
+does not search Cin7 again.
+When a sales-order mirror is enabled (see so_mirror), its exact matches
+are used first and its contains-matches only after the live exact search
+has missed.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from cin7_client import PAGE_SIZE, paginate_items, where_any
+from so_mirror import SalesOrderMirror
+
+# Only the sales-order fields the apps read. lineItems is included so a
+# found order carries its lines and a hit costs a single request; the
+# response is streamed, so only the order being examined is held.
+SO_FIELDS = ("id", "reference", "customerOrderNo", "company", "projectName",
+             "modifiedDate", "status", "dispatchedDate", "lineItems")
+
+# Seconds a found order is reused before Cin7 is searched again
+DEFAULT_CACHE_TTL = 120
+
+_finder: Optional["OrderFinder"] = None
+_finder_lock = threading.Lock()
+
+
+def _where_like(field: str, value: str) -> str:
+    return "{} like '%{}%'".format(field, value.replace("'", "''"))
+
+
+def _pick(rows: Iterator[Dict[str, Any]], q: str) -> Optional[Dict[str, Any]]:
+    """
+    Prefer the row whose reference is the Q-ref, then its customerOrderNo, then the first.
+
+    Stops reading (and paging) as soon as a reference match is seen.
+    """
+    first = by_customer_no = None
+    for row in rows:
+        if str(row.get("reference") or "").strip().upper() == q:
+            return row
+        if by_customer_no is None and str(row.get("customerOrderNo") or "").strip().upper() == q:
+            by_customer_no = row
+        if first is None:
+            first = row
+    return by_customer_no or first
+
+
+def order_line_items(so: Dict[str, Any], cin7_iter: Callable) -> Iterable[Dict[str, Any]]:
+    """
+    Line items of a found order.
+
+    Searches and the mirror return orders with their lines (decoded with
+    the order, one order at a time), so no further request is made. An
+    order without them (e.g. a mirror row synced with fewer fields) has its
+    lines streamed from v1/SalesOrders/{id} one item at a time.
+
+    Args:
+        so: Sales order from OrderFinder.find
+        cin7_iter: The app's streaming Cin7 GET helper
+
+    Returns:
+        Iterable of lineItems dicts (lazy when streamed; iterating may raise Cin7Error)
+    """
+    if "lineItems" in so:
+        return so["lineItems"]
+    return cin7_iter(f"v1/SalesOrders/{so['id']}", prefix="lineItems.item", fields=("lineItems",))
+
+
+class OrderFinder:
+    """Q-ref to sales-order search with a short-lived in-process cache."""
+
+    def __init__(self, ttl: int = DEFAULT_CACHE_TTL):
+        """
+        Args:
+            ttl: Seconds a found order is reused
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    def _search(self, cin7_iter: Callable, where: str, rows: int = PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        return paginate_items(cin7_iter, "v1/SalesOrders", params={"where": where},
+                              fields=SO_FIELDS, rows=rows)
+
+    def find(self, qref: str, cin7_iter: Callable,
+             mirror: Optional[SalesOrderMirror] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the sales order for a Q-ref.
+
+        Args:
+            qref: Quote / sales-order reference as typed
+            cin7_iter: The app's streaming Cin7 GET helper
+            mirror: Local sales-order mirror to try before Cin7 searches, if enabled
+
+        Returns:
+            Sales order dict, or None if nothing matches
+
+        Raises:
+            Cin7Error: A search failed
+        """
+        q = (qref or "").strip().upper()
+        if not q:
+            return None
+
+        if mirror is not None:
+            # Exact matches only: the mirror's contains-match must not win
+            # over an older order whose reference is exactly the Q-ref
+            so = mirror.find(q, exact_only=True)
+            if so is not None:
+                return so
+
+        with self._lock:
+            hit = self._cache.get(q)
+        if hit and time.time() - hit[0] < self.ttl:
+            return hit[1]
+
+        exact = where_any("reference", [q]) + " OR " + where_any("customerOrderNo", [q])
+        so = _pick(self._search(cin7_iter, exact), q)
+
+        if so is None and mirror is not None:
+            so = mirror.find(q)
+
+        if so is None:
+            # Wildcard scans are slow on Cin7's side, so run both at once
+            # and only when the exact match missed
+            wheres = [_where_like("reference", q), _where_like("customerOrderNo", q)]
+            with ThreadPoolExecutor(max_workers=len(wheres)) as pool:
+                # Only the first hit is used, so ask for a single row
+                hits = list(pool.map(lambda w: next(self._search(cin7_iter, w, rows=1), None), wheres))
+            so = next((hit for hit in hits if hit), None)
+
+        if so is not None:
+            now = time.time()
+            with self._lock:
+                # Expired orders are dropped so the cache holds only recent lookups
+                for key in [k for k, (at, _) in self._cache.items() if now - at >= self.ttl]:
+                    del self._cache[key]
+                self._cache[q] = (now, so)
+            if mirror is not None:
+                # Refreshes (or, if closed since, removes) the mirror's copy
+                mirror.upsert([so])
+        return so
+
+    def invalidate(self, qref: Optional[str] = None):
+        """Forget one cached Q-ref, or all of them."""
+        with self._lock:
+            if qref is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(qref.strip().upper(), None)
+
+
+def get_order_finder(ttl: int = DEFAULT_CACHE_TTL) -> OrderFinder:
+    """
+    Get the process-wide order finder, creating it on first use.
+
+    Args:
+        ttl: Seconds a found order is reused (only used on first call)
+
+    Returns:
+        Shared OrderFinder instance
+    """
+    global _finder
+    with _finder_lock:
+        if _finder is None:
+            _finder = OrderFinder(ttl)
+        return _finder
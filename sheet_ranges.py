@@ -0,0 +1,56 @@
+"""
+Sheet Ranges Module
+Column-projected reads from a gspread worksheet: the header row is read
+once, then only the wanted columns are fetched in a single batch_get, so
+wide sheets don't transfer columns the app never uses.
+"""
+
+from typing import Dict, Iterable, List
+
+from gspread.utils import numericise_all, rowcol_to_a1
+
+
+def column_letter(col: int) -> str:
+    """A1 letter(s) of a 1-based column number, e.g. 28 -> AB."""
+    return rowcol_to_a1(1, col)[:-1]
+
+
+def read_columns(worksheet, columns: Iterable[str], header_row: int = 1,
+                 numericise: bool = False) -> Dict[str, List]:
+    """
+    Fetch only the named columns of a worksheet.
+
+    Headers are matched after stripping whitespace; for duplicated headers
+    the first occurrence is used. Requested columns missing from the sheet
+    are left out of the result.
+
+    Args:
+        worksheet: gspread Worksheet
+        columns: Header names to fetch
+        header_row: Row holding the headers (data starts on the next row)
+        numericise: Convert numeric-looking cells like get_all_records does
+
+    Returns:
+        Dictionary of header to cell values, all columns padded to the same length
+    """
+    headers = [str(h).strip() for h in worksheet.row_values(header_row)]
+    positions: Dict[str, int] = {}
+    for col, header in enumerate(headers, start=1):
+        positions.setdefault(header, col)
+
+    wanted = [c for c in dict.fromkeys(columns) if c in positions]
+    if not wanted:
+        return {}
+
+    start = header_row + 1
+    ranges = [f"{column_letter(positions[c])}{start}:{column_letter(positions[c])}" for c in wanted]
+    value_ranges = worksheet.batch_get(ranges, major_dimension="COLUMNS")
+
+    # Sheets drops trailing blank cells, so columns can come back ragged
+    data = {c: (list(vr[0]) if vr and vr[0] else []) for c, vr in zip(wanted, value_ranges)}
+    length = max(len(v) for v in data.values())
+    for col, values in data.items():
+        values.extend([""] * (length - len(values)))
+        if numericise:
+            data[col] = numericise_all(values, empty2zero=False, default_blank="")
+    return data
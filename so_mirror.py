@@ -0,0 +1,302 @@
+"""
+Sales Order Mirror Module
+Optional local SQLite copy of recent, open Cin7 sales orders, kept current
+by an incremental sync on modifiedDate. Orders that are voided, dispatched
+or older than the mirror's window are pruned. Indexed by reference and
+customerOrderNo so Q-ref lookups (exact and wildcard) resolve locally
+instead of searching Cin7; the order finder falls back to a live search on
+a miss, and on any lookup while the mirror is not freshly synced.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from cin7_client import PAGE_SIZE, Cin7Error
+
+# Override with the SO_MIRROR_PATH environment variable (e.g. a mounted volume)
+DEFAULT_MIRROR_PATH = os.environ.get(
+    "SO_MIRROR_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "so_mirror.sqlite")
+)
+
+# Orders modified in this many days are mirrored (older ones are pruned)
+DEFAULT_INITIAL_DAYS = 90
+
+# Seconds between background syncs
+DEFAULT_SYNC_INTERVAL = 300
+
+# Lookups are answered only while the last sync is at most this old
+DEFAULT_MAX_STALE = 2 * DEFAULT_SYNC_INTERVAL
+
+# Fields the sync needs on top of the caller's, to tell open orders apart
+STATUS_FIELDS = ("id", "modifiedDate", "status", "dispatchedDate")
+
+# Statuses of orders that are no longer open
+CLOSED_STATUSES = ("VOID",)
+
+_mirrors: Dict[str, "SalesOrderMirror"] = {}
+_mirrors_lock = threading.Lock()
+
+
+def _key(value: Any) -> str:
+    return str(value or "").strip().upper()
+
+
+def _cin7_date(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def is_open(so: Dict[str, Any]) -> bool:
+    """True if a sales order is neither voided nor dispatched."""
+    return _key(so.get("status")) not in CLOSED_STATUSES and not so.get("dispatchedDate")
+
+
+class SalesOrderMirror:
+    """SQLite store of sales orders with reference/customerOrderNo indexes."""
+
+    def __init__(self, path: str = DEFAULT_MIRROR_PATH, initial_days: int = DEFAULT_INITIAL_DAYS,
+                 max_stale: int = DEFAULT_MAX_STALE):
+        """
+        Open (or create) the mirror database.
+
+        Args:
+            path: Location of the SQLite file
+            initial_days: How far back orders are mirrored
+            max_stale: Seconds since the last sync after which lookups miss
+        """
+        self.path = path
+        self.initial_days = initial_days
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                " id INTEGER PRIMARY KEY,"
+                " reference TEXT NOT NULL,"
+                " customer_order_no TEXT NOT NULL,"
+                " modified TEXT,"
+                " data TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS orders_reference ON orders (reference)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS orders_customer_order_no ON orders (customer_order_no)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._conn.commit()
+
+    def _meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._conn.commit()
+
+    def find(self, qref: str, exact_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Look a Q-ref up locally, in the same order as the live search.
+
+        Exact reference, exact customerOrderNo, then a contains-match on
+        either (most recently modified first).
+
+        Args:
+            qref: Quote / sales-order reference
+            exact_only: Skip the contains-match. The mirror only holds recent
+                orders, so a contains-match here can shadow an older order
+                whose reference is exactly the Q-ref
+
+        Returns:
+            Sales order dict, or None if the mirror has no match or has not
+            synced within max_stale (an edited or closed order could be
+            served otherwise)
+        """
+        q = _key(qref)
+        if not q:
+            return None
+        synced = self.last_synced()
+        if synced is None or time.time() - synced > self.max_stale:
+            return None
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        queries = [
+            ("SELECT data FROM orders WHERE reference = ? LIMIT 1", (q,)),
+            ("SELECT data FROM orders WHERE customer_order_no = ? LIMIT 1", (q,)),
+        ]
+        if not exact_only:
+            queries.append(
+                ("SELECT data FROM orders WHERE reference LIKE ? ESCAPE '\\'"
+                 " OR customer_order_no LIKE ? ESCAPE '\\' ORDER BY modified DESC LIMIT 1", (like, like))
+            )
+        with self._lock:
+            for sql, args in queries:
+                row = self._conn.execute(sql, args).fetchone()
+                if row:
+                    return json.loads(row[0])
+        return None
+
+    def upsert(self, orders: Iterable[Dict[str, Any]]):
+        """Insert or replace open orders by Cin7 id, and drop the ones no longer open."""
+        orders = [so for so in orders if so.get("id") is not None]
+        rows = [
+            (so["id"], _key(so.get("reference")), _key(so.get("customerOrderNo")),
+             so.get("modifiedDate"), json.dumps(so))
+            for so in orders if is_open(so)
+        ]
+        closed = [(so["id"],) for so in orders if not is_open(so)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO orders (id, reference, customer_order_no, modified, data)"
+                " VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.executemany("DELETE FROM orders WHERE id = ?", closed)
+            self._conn.commit()
+
+    def prune(self) -> int:
+        """Delete orders last modified before the mirror's window; returns the count."""
+        cutoff = _cin7_date(datetime.now(timezone.utc) - timedelta(days=self.initial_days))
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM orders WHERE modified < ?", (cutoff,))
+            self._conn.commit()
+        return cur.rowcount
+
+    def count(self) -> int:
+        """Number of orders held locally."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def last_synced(self) -> Optional[float]:
+        """Unix time of the last successful sync, or None if never synced."""
+        value = self._meta("synced_at")
+        return float(value) if value else None
+
+    def _changed_pages(self, cin7_get: Callable, since: str, fields: Iterable[str],
+                       where: str = "") -> Iterator[List[Dict[str, Any]]]:
+        """
+        Pages of orders modified at or after `since`, oldest first.
+
+        Keyset walk: each page is re-queried from the newest modifiedDate
+        seen so far instead of by offset, so an order edited during the walk
+        moves ahead (and is fetched again) rather than shifting across a
+        page boundary and being skipped. Offsets are only used while a whole
+        page shares one modifiedDate.
+        """
+        mark, page, seen = since, 1, set()
+        while True:
+            clause = f"modifiedDate >= '{mark}'" + (f" AND {where}" if where else "")
+            rows = cin7_get("v1/SalesOrders", params={
+                "where": clause, "order": "modifiedDate", "rows": PAGE_SIZE, "page": page,
+            }, fields=fields) or []
+            fresh = [so for so in rows if so.get("id") not in seen]
+            if fresh:
+                yield fresh
+            if len(rows) < PAGE_SIZE:
+                return
+            newest = max(so.get("modifiedDate") or mark for so in rows)
+            at_newest = {so.get("id") for so in rows if so.get("modifiedDate") == newest}
+            if newest == mark:
+                page += 1
+                seen |= at_newest
+            else:
+                mark, page, seen = newest, 1, at_newest
+
+    def sync(self, cin7_get: Callable, fields: Iterable[str]) -> int:
+        """
+        Pull orders modified since the last sync and prune closed or old ones.
+
+        The watermark is the newest modifiedDate seen; the next sync asks for
+        modifiedDate >= watermark, so edits in the same second are not missed
+        (re-fetched rows simply replace themselves). The first sync asks Cin7
+        for non-void orders only; later syncs must see every change, so that
+        orders closed since are removed.
+
+        Args:
+            cin7_get: The app's Cin7 GET helper
+            fields: Sales-order fields to mirror (STATUS_FIELDS are added)
+
+        Returns:
+            Number of orders fetched
+
+        Raises:
+            Cin7Error: A page failed; rows already stored are kept and the
+                watermark is not advanced past them
+        """
+        fields = tuple(dict.fromkeys(tuple(fields) + STATUS_FIELDS))
+        with self._sync_lock:
+            since = self._meta("watermark")
+            where = ""
+            if since is None:
+                since = _cin7_date(datetime.now(timezone.utc) - timedelta(days=self.initial_days))
+                where = " AND ".join(f"status <> '{s}'" for s in CLOSED_STATUSES)
+
+            fetched = 0
+            newest = since
+            # Stored a page at a time so an interrupted sync keeps its progress
+            for rows in self._changed_pages(cin7_get, since, fields, where):
+                self.upsert(rows)
+                fetched += len(rows)
+                for so in rows:
+                    newest = max(newest, so.get("modifiedDate") or newest)
+                self._set_meta("watermark", newest)
+
+            self.prune()
+            self._set_meta("watermark", newest)
+            self._set_meta("synced_at", str(time.time()))
+            return fetched
+
+    def sync_in_background(self, cin7_get: Callable, fields: Iterable[str],
+                           interval: int = DEFAULT_SYNC_INTERVAL) -> bool:
+        """
+        Start a sync on a daemon thread if the last one is older than interval.
+
+        Returns:
+            True if a sync was started
+        """
+        synced = self.last_synced()
+        if synced is not None and time.time() - synced < interval:
+            return False
+        if self._sync_lock.locked():
+            return False
+
+        def run():
+            try:
+                self.sync(cin7_get, fields)
+            except Cin7Error:
+                # Lookups fall back to Cin7; the next interval retries
+                pass
+
+        threading.Thread(target=run, name="so-mirror-sync", daemon=True).start()
+        return True
+
+
+def get_so_mirror(path: str = DEFAULT_MIRROR_PATH, initial_days: int = DEFAULT_INITIAL_DAYS,
+                  max_stale: int = DEFAULT_MAX_STALE) -> SalesOrderMirror:
+    """
+    Get the process-wide mirror for a path, creating it on first use.
+
+    Args:
+        path: Location of the SQLite file
+        initial_days: How far back orders are mirrored (only used on first call)
+        max_stale: Seconds since the last sync after which lookups miss
+            (only used on first call)
+
+    Returns:
+        Shared SalesOrderMirror instance
+    """
+    with _mirrors_lock:
+        mirror = _mirrors.get(path)
+        if mirror is None:
+            mirror = _mirrors[path] = SalesOrderMirror(path, initial_days, max_stale)
+        return mirror
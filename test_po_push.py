@@ -0,0 +1,92 @@
+"""
+Regression tests for PO references and the submission journal
+Run with: python -m pytest test_po_push.py
+"""
+
+import time
+
+import pytest
+
+import po_journal
+from po_journal import IN_FLIGHT, PoJournal
+from po_push import po_references, push_pos_once
+
+
+def _payloads(qref, suppliers):
+    refs = po_references(qref, suppliers)
+    return [(name, refs[name], {"reference": refs[name], "supplierId": cid, "lineItems": []})
+            for name, cid in suppliers]
+
+
+def _push_recorder(sent):
+    def push(items):
+        for sup, ref, payload in items:
+            sent.append(payload)
+            yield {"supplier": sup, "reference": ref, "ok": True, "status_code": 200,
+                   "seconds": 0, "response": "", "cin7_id": len(sent), "skipped": False}
+    return push
+
+
+def _no_existing_pos(endpoint, params=None, fields=None):
+    return []
+
+
+def test_suppliers_sharing_a_prefix_get_distinct_refs():
+    refs = po_references("Q1", [("ACME Ltd", 11), ("ACME Tools", 12), ("Bolt Co", 13)])
+    assert refs["Bolt Co"] == "PO-Q1BOLT"
+    assert refs["ACME Ltd"] != refs["ACME Tools"]
+    assert refs["ACME Ltd"].startswith("PO-Q1ACME")
+
+
+def test_colliding_suppliers_are_both_sent_once(tmp_path):
+    journal = PoJournal(str(tmp_path / "journal.sqlite"))
+    payloads = _payloads("Q1", [("ACME Ltd", 11), ("ACME Tools", 12)])
+    sent = []
+
+    first = list(push_pos_once(payloads, journal, _no_existing_pos, _push_recorder(sent)))
+    assert [p["supplierId"] for p in sent] == [11, 12]
+    assert all(r["ok"] and not r["skipped"] for r in first)
+
+    rerun = list(push_pos_once(payloads, journal, _no_existing_pos, _push_recorder(sent)))
+    assert len(sent) == 2
+    assert all(r["ok"] and r["skipped"] for r in rerun)
+
+
+def test_duplicate_refs_in_one_run_fail_before_claiming(tmp_path):
+    journal = PoJournal(str(tmp_path / "journal.sqlite"))
+    payloads = [("ACME Ltd", "PO-Q1ACME", {"supplierId": 11}),
+                ("ACME Tools", "PO-Q1ACME", {"supplierId": 12})]
+
+    with pytest.raises(ValueError):
+        list(push_pos_once(payloads, journal, _no_existing_pos, _push_recorder([])))
+    assert journal.get("PO-Q1ACME") is None
+
+
+def test_forget_allows_a_sent_po_to_be_raised_again(tmp_path):
+    journal = PoJournal(str(tmp_path / "journal.sqlite"))
+    payloads = _payloads("Q1", [("Bolt Co", 13)])
+    sent = []
+
+    list(push_pos_once(payloads, journal, _no_existing_pos, _push_recorder(sent)))
+    assert journal.forget("PO-Q1BOLT")
+    assert not journal.forget("PO-Q1BOLT")
+    list(push_pos_once(payloads, journal, _no_existing_pos, _push_recorder(sent)))
+    assert len(sent) == 2
+
+
+def test_slow_push_keeps_its_claim(tmp_path, monkeypatch):
+    monkeypatch.setattr(po_journal, "CLAIM_HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(po_journal, "IN_FLIGHT_TIMEOUT", 0.3)
+    path = str(tmp_path / "journal.sqlite")
+    journal = PoJournal(path)
+    payloads = _payloads("Q1", [("Bolt Co", 13)])
+    sent = []
+
+    def slow_push(items):
+        # Throttled well past IN_FLIGHT_TIMEOUT; another session tries meanwhile
+        time.sleep(1.0)
+        assert PoJournal(path).claim("PO-Q1BOLT", "other") == IN_FLIGHT
+        yield from _push_recorder(sent)(items)
+
+    results = list(push_pos_once(payloads, journal, _no_existing_pos, slow_push))
+    assert len(sent) == 1 and results[0]["ok"]